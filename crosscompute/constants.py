@@ -18,6 +18,8 @@ class Error(IntEnum):
     CONFIGURATION_NOT_FOUND = -100
     IMAGE_NOT_RUNNABLE = -20
     COMMAND_NOT_RUNNABLE = -10
+    COMMAND_CANCELLED = -3
+    COMMAND_TIMED_OUT = -2
     COMMAND_INTERRUPTED = -1
 
 
@@ -35,6 +37,7 @@ class Task:
 
     RUN_PRINT = 'r'
     PRINT_ONLY = 'p'
+    CANCEL = 'c'
 
 
 PACKAGE_FOLDER = Path(__file__).parent
@@ -48,6 +51,11 @@ TEMPLATE_PATH_BY_ID = {
     'step': str(ASSETS_FOLDER / 'step.html')}
 CACHE_FOLDER = Path('~/.crosscompute').expanduser()
 FILES_FOLDER = CACHE_FOLDER / 'files'
+RESULTS_FOLDER = CACHE_FOLDER / 'results'
+CONTAINERS_FOLDER = CACHE_FOLDER / 'containers'
+ENVIRONMENTS_FOLDER = CACHE_FOLDER / 'environments'
+DATASETS_FOLDER = CACHE_FOLDER / 'datasets'
+BLOBS_FOLDER = DATASETS_FOLDER / 'blobs'
 
 
 ID_LENGTH = 32
@@ -74,6 +82,7 @@ LOGO_PATH = ASSETS_FOLDER / 'LogoBrand-Horizontal-20230501.svg'
 
 HOST = '127.0.0.1'
 PORT = 7000
+COORDINATOR_PORT = 7100
 DISK_DEBOUNCE_IN_MILLISECONDS = 1600
 DISK_STEP_IN_MILLISECONDS = 50
 
@@ -86,6 +95,8 @@ FILES_ROUTE = '/files.json'
 STREAM_ROUTE = '/streams'
 STYLE_ROUTE = '/assets/{style_name}.css'
 MUTATION_ROUTE = '/mutations{uri}.json'
+QUEUE_ROUTE = '/queue.json'
+CANCEL_ROUTE = '/cancel.json'
 PORT_ROUTE = '/ports{uri}'
 
 
@@ -93,6 +104,13 @@ PRINTER_NAMES = 'pdf',
 
 
 PACKAGE_MANAGER_NAMES = 'apt', 'dnf', 'npm', 'pip'
+CONTAINER_IDLE_TEXT = '10 minutes'
+RETRY_BACKOFF_TEXT = '10 seconds'
+DOWNLOAD_TIMEOUT_IN_SECONDS = 60
+DOWNLOAD_CHUNK_SIZE_IN_BYTES = 1024 * 1024
+TEMPORARY_FILE_AGE_IN_SECONDS = 3600
+MAXIMUM_QUEUE_LENGTH = 100
+BATCH_CHUNK_SIZE = 100
 DESIGN_NAMES_BY_PAGE_ID = {
     'automation': ['input', 'output', 'none'],
     'input': ['flex', 'none'],
@@ -106,22 +124,25 @@ BUTTON_TEXT_BY_ID = {
 
 
 INTERVAL_UNIT_NAMES = 'seconds', 'minutes', 'hours', 'days', 'weeks'
+SIZE_UNIT_NAMES = 'B', 'KB', 'MB', 'GB', 'TB'
 STEP_NAMES = 'input', 'output', 'log', 'debug', 'print'
 STEP_NAME_BY_CODE = {_[0]: _ for _ in STEP_NAMES}
 STEP_CODE_BY_NAME = {k: v for v, k in STEP_NAME_BY_CODE.items()}
 MAXIMUM_MUTATION_AGE_IN_SECONDS = 180
 
 
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}$')
 VARIABLE_ID_PATTERN = re.compile(r'[a-zA-Z0-9-_ ]+$')
 VARIABLE_ID_WHITELIST_PATTERN = re.compile(r'{ *(ROOT_URI) *}')
 VARIABLE_ID_TEMPLATE_PATTERN = re.compile(r'{ *([a-zA-Z0-9-_| ]+?) *}')
-CACHED_FILE_SIZE_LIMIT_IN_BYTES = 1024
-MAXIMUM_FILE_CACHE_LENGTH = 256
+CACHED_FILE_SIZE_LIMIT_IN_BYTES = 1024 * 1024
 
 
 MINIMUM_PORT = int(getenv('CROSSCOMPUTE_MINIMUM_PORT', 1024))
 MAXIMUM_PORT = int(getenv('CROSSCOMPUTE_MAXIMUM_PORT', 65535))
 PROXY_URI = getenv('CROSSCOMPUTE_PROXY_URI', '')
+FILE_CACHE_SIZE_IN_BYTES = int(getenv(
+    'CROSSCOMPUTE_FILE_CACHE_SIZE_IN_BYTES', 64 * 1024 * 1024))
 
 
 DEBUG_VARIABLE_DICTIONARIES = [{
@@ -135,7 +156,19 @@ DEBUG_VARIABLE_DICTIONARIES = [{
 }, {
     'id': 'return_code',
     'view': 'number',
-    'path': 'variables.dictionary'}]
+    'path': 'variables.dictionary',
+}] + [{
+    'id': _,
+    'view': 'number',
+    'path': 'variables.dictionary',
+} for _ in [
+    'attempt_count',
+    'maximum_memory_in_bytes',
+    'user_time_in_seconds',
+    'system_time_in_seconds',
+    'read_size_in_bytes',
+    'write_size_in_bytes',
+    'output_size_in_bytes']]
 
 
 LOGGING_TIMESTAMP = '%Y%m%d-%H%M%S'
@@ -1,23 +1,158 @@
-from os.path import getmtime
+from collections import OrderedDict
+from fnmatch import fnmatch
+from os import stat, walk
+from pathlib import Path
+from threading import Lock
 
-from .iterable import LRUDict
+from .resource import get_memory_size
 
 
-class FileCache(LRUDict):
+class FileCache(OrderedDict):
+    # Bound entries by the estimated memory of their loaded values
 
-    def __init__(self, *args, load_file_data, maximum_length: int, **kwargs):
-        super().__init__(*args, maximum_length=maximum_length, **kwargs)
+    def __init__(
+            self, *args, load_file_data, maximum_size_in_bytes: int,
+            measure_file_data=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.maximum_size_in_bytes = maximum_size_in_bytes
+        self.size_in_bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
         self._load_file_data = load_file_data
+        self._measure_file_data = measure_file_data or get_memory_size
+        self._lock = Lock()
+        self._watched_folders = ()
+        self._watch_id = None
+        self._change_count = 0
 
     def __getitem__(self, path):
-        if path in self:
-            file_time, file_data = super().__getitem__(path)
-            if getmtime(path) == file_time:
+        with self._lock:
+            try:
+                file_time, file_data, watch_id, _, _ = super().__getitem__(
+                    path)
+                self.move_to_end(path)
+            except KeyError:
+                watch_id = file_time = None
+            change_count = self._change_count
+        if file_time is not None:
+            # Trust entries that a watcher would have invalidated
+            if watch_id is not None and watch_id is self._watch_id or stat(
+                    path).st_mtime == file_time:
+                with self._lock:
+                    self.hit_count += 1
                 return file_data
+        with self._lock:
+            self.miss_count += 1
         file_data = self._load_file_data(path)
-        self.__setitem__(path, file_data)
+        self._store(path, file_data, change_count)
         return file_data
 
     def __setitem__(self, path, data):
-        value = (getmtime(path), data)
-        super().__setitem__(path, value)
+        self._store(path, data, self._change_count)
+
+    def watch(self, folders):
+        with self._lock:
+            self._watched_folders = tuple(Path(_).resolve() for _ in folders)
+            self._watch_id = object()
+
+    def unwatch(self):
+        with self._lock:
+            self._watched_folders = ()
+            self._watch_id = None
+
+    def invalidate(self, paths):
+        changed_paths = {Path(_).resolve() for _ in paths}
+        with self._lock:
+            self._change_count += 1
+            for path, (_, _, _, resolved_path, _) in list(self.items()):
+                if resolved_path is None:
+                    continue
+                # Match parents too because a folder might have been replaced
+                if resolved_path in changed_paths or not (
+                        changed_paths.isdisjoint(resolved_path.parents)):
+                    self._remove(path)
+
+    def get_statistics(self):
+        with self._lock:
+            return {
+                'size_in_bytes': self.size_in_bytes,
+                'maximum_size_in_bytes': self.maximum_size_in_bytes,
+                'hit_count': self.hit_count,
+                'miss_count': self.miss_count,
+                'eviction_count': self.eviction_count}
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self.size_in_bytes = 0
+
+    def _store(self, path, data, change_count):
+        path_stat = stat(path)
+        data_size = ENTRY_SIZE_IN_BYTES + self._measure_file_data(data)
+        watch_id, watched_folders = self._watch_id, self._watched_folders
+        resolved_path = Path(path).resolve() if watched_folders else None
+        if resolved_path is None or not any(
+                resolved_path.is_relative_to(_) for _ in watched_folders):
+            watch_id = resolved_path = None
+        with self._lock:
+            if path in self:
+                self._remove(path)
+            if data_size > self.maximum_size_in_bytes:
+                return
+            # Fall back to stat if a change arrived while the file was loading
+            if change_count != self._change_count:
+                watch_id = None
+            super().__setitem__(path, (
+                path_stat.st_mtime, data, watch_id, resolved_path, data_size))
+            self.size_in_bytes += data_size
+            while self.size_in_bytes > self.maximum_size_in_bytes:
+                self._remove(next(iter(self)))
+                self.eviction_count += 1
+
+    def _remove(self, path):
+        self.size_in_bytes -= super().pop(path)[-1]
+
+
+def update_hash(h, path, excluded_patterns=()):
+    path = Path(path)
+    if path.is_dir():
+        for folder, folder_names, file_names in walk(path):
+            relative_folder = Path(folder).relative_to(path)
+            folder_names[:] = sorted(
+                _ for _ in folder_names if not is_excluded(
+                    relative_folder / _, excluded_patterns))
+            for file_name in sorted(file_names):
+                relative_path = relative_folder / file_name
+                if is_excluded(relative_path, excluded_patterns):
+                    continue
+                h.update(str(relative_path).encode())
+                update_hash_from_file(h, path / relative_path)
+    elif path.exists():
+        update_hash_from_file(h, path)
+    return h
+
+
+def update_hash_from_file(h, path):
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE_IN_BYTES):
+            h.update(chunk)
+    return h
+
+
+def is_excluded(relative_path, excluded_patterns):
+    # Match patterns the way .containerignore and .dockerignore do
+    relative_text = relative_path.as_posix()
+    for pattern in excluded_patterns:
+        if pattern.startswith('**/'):
+            name_pattern = pattern[3:]
+            if any(fnmatch(_, name_pattern) for _ in relative_path.parts):
+                return True
+        elif fnmatch(relative_text, pattern) or relative_text.startswith(
+                pattern.rstrip('/') + '/'):
+            return True
+    return False
+
+
+CHUNK_SIZE_IN_BYTES = 1024 * 1024
+ENTRY_SIZE_IN_BYTES = 256
@@ -1,25 +1,5 @@
 import operator
-from collections import OrderedDict, defaultdict
-
-
-class LRUDict(OrderedDict):
-    # https://gist.github.com/davesteele/44793cd0348f59f8fadd49d7799bd306
-
-    def __init__(self, *args, maximum_length: int, **kwargs):
-        assert maximum_length > 0
-        self.maximum_length = maximum_length
-        super().__init__(*args, **kwargs)
-
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
-        super().move_to_end(key)
-        while len(self) > self.maximum_length:
-            super().__delitem__(next(iter(self)))
-
-    def __getitem__(self, key):
-        value = super().__getitem__(key)
-        super().move_to_end(key)
-        return value
+from collections import defaultdict
 
 
 def group_by(items, key):
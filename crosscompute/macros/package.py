@@ -1,4 +1,6 @@
 from importlib import import_module
+from pathlib import Path
+
 from packaging import version
 
 
@@ -7,6 +9,15 @@ def import_attribute(attribute_string):
     return getattr(import_module(module_string), attribute_name)
 
 
+def get_module_path(folder, attribute_string):
+    module_string = attribute_string.rsplit('.', maxsplit=1)[0]
+    module_path = Path(folder, *module_string.split('.'))
+    package_path = module_path / '__init__.py'
+    if package_path.exists():
+        return package_path
+    return module_path.with_suffix('.py')
+
+
 def is_equivalent_version(version_a, version_b, version_depth=3):
     normalized_version_a = normalize_version(version_a, version_depth)
     normalized_version_b = normalize_version(version_b, version_depth)
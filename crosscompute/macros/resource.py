@@ -0,0 +1,68 @@
+from sys import getsizeof
+
+
+def get_usage_by_name(rusage, old_rusage=None):
+    usage_by_name = {
+        'maximum_memory_in_bytes': rusage.ru_maxrss * 1024,
+        'user_time_in_seconds': rusage.ru_utime,
+        'system_time_in_seconds': rusage.ru_stime,
+        'read_size_in_bytes': rusage.ru_inblock * BLOCK_SIZE_IN_BYTES,
+        'write_size_in_bytes': rusage.ru_oublock * BLOCK_SIZE_IN_BYTES}
+    if old_rusage:
+        old_usage_by_name = get_usage_by_name(old_rusage)
+        for name in SUMMED_USAGE_NAMES:
+            usage_by_name[name] -= old_usage_by_name[name]
+    return usage_by_name
+
+
+def reset_maximum_memory():
+    # Linux resets the peak resident set size of this process on 5
+    try:
+        with open('/proc/self/clear_refs', 'wt') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def merge_usage_by_name(usage_by_name, new_usage_by_name):
+    for name, value in new_usage_by_name.items():
+        old_value = usage_by_name.get(name, 0)
+        if name in SUMMED_USAGE_NAMES:
+            usage_by_name[name] = old_value + value
+        else:
+            usage_by_name[name] = max(old_value, value)
+    return usage_by_name
+
+
+def get_folder_size(folder):
+    return sum(
+        _.stat().st_size for _ in folder.rglob('*')
+        if _.is_file() and not _.is_symlink())
+
+
+def get_memory_size(x):
+    # Walk containers because getsizeof counts only their references
+    memory_size, seen_ids, xs = 0, set(), [x]
+    while xs:
+        x = xs.pop()
+        if id(x) in seen_ids:
+            continue
+        seen_ids.add(id(x))
+        memory_size += getsizeof(x)
+        if isinstance(x, dict):
+            xs.extend(x.keys())
+            xs.extend(x.values())
+        elif isinstance(x, (list, tuple, set)):
+            xs.extend(x)
+    return memory_size
+
+
+# Linux counts block operations in units of 512 bytes
+BLOCK_SIZE_IN_BYTES = 512
+SUMMED_USAGE_NAMES = [
+    'user_time_in_seconds',
+    'system_time_in_seconds',
+    'read_size_in_bytes',
+    'write_size_in_bytes']
+USAGE_NAMES = ['maximum_memory_in_bytes'] + SUMMED_USAGE_NAMES
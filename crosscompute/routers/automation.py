@@ -1,4 +1,5 @@
 from pathlib import Path
+from threading import Lock
 from time import time
 
 from fastapi import APIRouter, Depends, Request, Response, HTTPException
@@ -13,7 +14,9 @@ from ..constants import (
     Task,
     AUTOMATION_ROUTE,
     BATCH_ROUTE,
+    CANCEL_ROUTE,
     ID_LENGTH,
+    QUEUE_ROUTE,
     STEP_ROUTE,
     VARIABLE_ROUTE)
 from ..dependencies import (
@@ -29,6 +32,8 @@ from ..routines.configuration import (
     AutomationDefinition,
     BatchDefinition,
     VariableDefinition)
+from ..routines.database import (
+    FILE_JSON_CACHE)
 from ..routines.step import (
     get_automation_response_dictionary,
     get_layout_settings,
@@ -36,6 +41,7 @@ from ..routines.step import (
 from ..routines.uri import (
     get_host_uri)
 from ..routines.variable import (
+    FILE_DATA_CACHE,
     load_file_text,
     remove_variable_data)
 from ..settings import (
@@ -114,18 +120,37 @@ async def run_automation_json(
     guard: AuthorizationGuard = Depends(
         AuthorizationGuardFactory('run_automation')),
 ):
-    runs_folder = automation_definition.folder / 'runs'
-    folder = Path(make_random_folder(runs_folder, ID_LENGTH))
-    batch_definition = BatchDefinition({
-        'folder': folder}, data_by_id=data_by_id, is_run=True)
-    debug_folder = folder / 'debug'
-    guard.save_identities(debug_folder / 'identities.dictionary')
-    remove_variable_data(debug_folder / 'variables.dictionary', [
-        'return_code'])
+    automation_slug = automation_definition.slug
+    queue = site['queues'].get(automation_slug, {})
+    submitted_count_by_slug = site['submitted_count_by_slug']
+    with SUBMISSION_LOCK:
+        # Count runs that the scheduler has not collected yet
+        submitted_count = submitted_count_by_slug.get(automation_slug, 0)
+        pending_count = queue.get('pending_count', 0) + submitted_count - (
+            queue.get('collected_count', 0))
+        if pending_count >= automation_definition.queue_length:
+            raise HTTPException(status_code=429, headers={
+                'Retry-After': str(max(1, queue.get('retry_in_seconds', 0)))})
+        submitted_count_by_slug[automation_slug] = submitted_count + 1
+    try:
+        runs_folder = automation_definition.folder / 'runs'
+        folder = Path(make_random_folder(runs_folder, ID_LENGTH))
+        batch_definition = BatchDefinition({
+            'folder': folder}, data_by_id=data_by_id, is_run=True)
+        debug_folder = folder / 'debug'
+        guard.save_identities(debug_folder / 'identities.dictionary')
+        remove_variable_data(debug_folder / 'variables.dictionary', [
+            'return_code'])
+    except Exception:
+        # Release the reserved slot because no task will be collected
+        with SUBMISSION_LOCK:
+            submitted_count_by_slug[automation_slug] -= 1
+        raise
 
     site['tasks'].append((
         automation_definition, batch_definition, site['environment'],
         Task.RUN_PRINT))
+    site['wakeup'].set()
     automation_definition.batch_definitions.append(batch_definition)
 
     step_code = 'l' if automation_definition.get_variable_definitions(
@@ -135,6 +160,38 @@ async def run_automation_json(
         'step_code': step_code}
 
 
+@router.post(
+    AUTOMATION_ROUTE + BATCH_ROUTE + CANCEL_ROUTE,
+    tags=['automation'])
+async def cancel_automation_batch_json(
+    automation_definition: AutomationDefinition = Depends(
+        get_automation_definition),
+    batch_definition: BatchDefinition = Depends(get_batch_definition),
+    guard: AuthorizationGuard = Depends(
+        AuthorizationGuardFactory('run_automation')),
+):
+    site['tasks'].append((
+        automation_definition, batch_definition, site['environment'],
+        Task.CANCEL))
+    site['wakeup'].set()
+    return {}
+
+
+@router.get(
+    AUTOMATION_ROUTE + QUEUE_ROUTE,
+    tags=['automation'])
+async def see_automation_queue_json(
+    automation_definition: AutomationDefinition = Depends(
+        get_automation_definition),
+    guard: AuthorizationGuard = Depends(
+        AuthorizationGuardFactory('see_automation')),
+):
+    return site['queues'].get(automation_definition.slug, {}) | {
+        'file_cache_by_name': {
+            'data': FILE_DATA_CACHE.get_statistics(),
+            'json': FILE_JSON_CACHE.get_statistics()}}
+
+
 @router.get(
     AUTOMATION_ROUTE + BATCH_ROUTE + STEP_ROUTE + VARIABLE_ROUTE + '.json',
     tags=['automation'])
@@ -191,3 +248,6 @@ async def see_automation_batch_step_variable(
             R = Response
             x = str(x)
     return R(x, headers=response.headers)
+
+
+SUBMISSION_LOCK = Lock()
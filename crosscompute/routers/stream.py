@@ -27,6 +27,7 @@ async def see_mutation_stream(
 
     async def loop():
         live_uris.append(reference_uri)
+        site['wakeup'].set()
         reference_time = old_time
         try:
             while True:
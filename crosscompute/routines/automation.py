@@ -29,9 +29,14 @@ from .printer import (
     printer_by_name)
 from .server import DiskServer
 from .work import (
+    get_shard_index,
+    is_batch_changed,
     prepare_automation,
     process_loop,
-    run_automation)
+    run_automation,
+    run_coordinator,
+    run_worker,
+    update_datasets)
 
 
 class DiskAutomation(Automation):
@@ -58,6 +63,37 @@ class DiskAutomation(Automation):
         for automation_definition in definitions:
             run_automation(automation_definition, environment, with_rebuild)
 
+    def shard(self, shard_index, shard_count):
+        for automation_definition in self.definitions:
+            batch_definitions = [
+                _ for _ in automation_definition.batch_definitions
+                if get_shard_index(_.slug, shard_count) == shard_index]
+            automation_definition.batch_definitions = batch_definitions
+            L.info(
+                '%s %s shard %s/%s has %s batches',
+                automation_definition.name, automation_definition.version,
+                shard_index + 1, shard_count, len(batch_definitions))
+
+    def select_changed(self):
+        for automation_definition in self.definitions:
+            # Record digests so that the next run can skip unchanged batches
+            automation_definition.with_digest = True
+            update_datasets(automation_definition)
+            batch_definitions = [
+                _ for _ in automation_definition.batch_definitions
+                if is_batch_changed(automation_definition, _)]
+            automation_definition.batch_definitions = batch_definitions
+            L.info(
+                '%s %s has %s changed batches',
+                automation_definition.name, automation_definition.version,
+                len(batch_definitions))
+
+    def coordinate(self, address_text):
+        run_coordinator(self.definitions, address_text)
+
+    def work(self, environment, address_text, with_rebuild=True):
+        run_worker(self.definitions, address_text, environment, with_rebuild)
+
     def serve(
             self, environment, host=HOST, port=PORT, root_uri='',
             allowed_origins=None, with_restart=True, with_prefix=True,
@@ -67,9 +103,11 @@ class DiskAutomation(Automation):
             uris = manager.list()
             tasks = manager.list()
             changes = manager.dict()
+            wakeup = manager.Event()
+            queues = manager.dict()
             DiskServer(
                 process_loop, environment, safe,
-                uris, tasks, changes,
+                uris, tasks, changes, wakeup, queues,
                 host, port, root_uri, allowed_origins,
                 with_restart, with_prefix, with_hidden,
             ).watch(self.configuration, self._reload)
@@ -0,0 +1,120 @@
+import json
+import shutil
+from hashlib import sha256
+from logging import getLogger
+from os import walk
+from pathlib import Path
+from tempfile import mkdtemp
+
+from invisibleroads_macros_disk import make_folder
+
+from ..constants import (
+    RESULTS_FOLDER)
+from ..macros.disk import update_hash
+
+
+def get_batch_digest(
+        automation_definition, batch_folder, batch_environment,
+        dataset_digest_by_path):
+    h = sha256()
+    automation_folder = automation_definition.folder
+    update_hash(h, automation_folder / batch_folder / 'input')
+    for script_definition in automation_definition.script_definitions:
+        h.update(get_json_bytes(script_definition))
+        for path in script_definition.get_source_paths():
+            update_hash(h, path)
+    for dataset_path, dataset_digest in dataset_digest_by_path.items():
+        h.update(dataset_path.encode())
+        h.update(dataset_digest.encode())
+    h.update(get_json_bytes({
+        k: sorted(v) for k, v in
+        automation_definition.package_ids_by_manager_name.items()}))
+    h.update(get_json_bytes(batch_environment))
+    return h.hexdigest()
+
+
+def get_dataset_digest_by_path(automation_definition):
+    automation_folder = automation_definition.folder
+    return {str(_.path): get_path_digest(
+        automation_folder / _.path,
+    ) for _ in automation_definition.dataset_definitions}
+
+
+def get_path_digest(path):
+    try:
+        path_stat = path.stat()
+    except OSError:
+        return ''
+    # Skip hashing paths that have not changed since their last hash
+    if path.is_dir():
+        stat_key = get_folder_stat_key(path)
+    else:
+        stat_key = get_stat_key(path_stat)
+    try:
+        return DIGEST_BY_STAT_KEY[stat_key]
+    except KeyError:
+        pass
+    digest = DIGEST_BY_STAT_KEY[stat_key] = update_hash(
+        sha256(), path).hexdigest()
+    return digest
+
+
+def get_folder_stat_key(folder):
+    stat_packs = []
+    for parent_folder, folder_names, file_names in walk(folder):
+        folder_names.sort()
+        for file_name in sorted(file_names):
+            path = Path(parent_folder, file_name)
+            stat_packs.append((
+                str(path.relative_to(folder)),
+                get_stat_key(path.stat())))
+    return tuple(stat_packs)
+
+
+def get_stat_key(path_stat):
+    return (
+        path_stat.st_dev, path_stat.st_ino, path_stat.st_size,
+        path_stat.st_mtime_ns)
+
+
+def restore_batch(absolute_batch_folder, batch_digest):
+    cache_folder = RESULTS_FOLDER / batch_digest
+    if not cache_folder.exists():
+        return False
+    for step_name in CACHED_STEP_NAMES:
+        source_folder = cache_folder / step_name
+        target_folder = absolute_batch_folder / step_name
+        if step_name != 'debug':
+            shutil.rmtree(target_folder, ignore_errors=True)
+        if source_folder.exists():
+            shutil.copytree(source_folder, target_folder, dirs_exist_ok=True)
+    return True
+
+
+def save_batch(absolute_batch_folder, batch_digest):
+    cache_folder = RESULTS_FOLDER / batch_digest
+    if cache_folder.exists():
+        return
+    temporary_folder = Path(mkdtemp(dir=make_folder(RESULTS_FOLDER)))
+    try:
+        for step_name in CACHED_STEP_NAMES:
+            source_folder = absolute_batch_folder / step_name
+            if not source_folder.exists():
+                continue
+            shutil.copytree(
+                source_folder, temporary_folder / step_name,
+                ignore=shutil.ignore_patterns(*UNCACHED_FILE_NAMES))
+        temporary_folder.rename(cache_folder)
+    except OSError as e:
+        L.warning('could not cache %s; %s', absolute_batch_folder, e)
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+
+
+def get_json_bytes(x):
+    return json.dumps(x, sort_keys=True, default=str).encode()
+
+
+CACHED_STEP_NAMES = 'output', 'log', 'debug'
+UNCACHED_FILE_NAMES = 'identities.dictionary', 'ports.dictionary'
+DIGEST_BY_STAT_KEY = {}
+L = getLogger(__name__)
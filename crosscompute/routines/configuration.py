@@ -1,11 +1,13 @@
 # TODO: Save to ini, toml
 import hashlib
+import shlex
 import shutil
 from collections import Counter, defaultdict
 from configparser import ConfigParser
 from datetime import datetime, timedelta
 from logging import getLogger
-from os import environ
+from math import ceil
+from os import cpu_count, environ
 from os.path import basename, exists, getmtime, relpath, splitext
 from pathlib import Path
 from string import Template
@@ -29,8 +31,10 @@ from ..constants import (
     AUTOMATION_NAME,
     AUTOMATION_ROUTE,
     AUTOMATION_VERSION,
+    BATCH_CHUNK_SIZE,
     BATCH_ROUTE,
     BUTTON_TEXT_BY_ID,
+    CONTAINER_IDLE_TEXT,
     COPYRIGHT_IMAGE_URI,
     COPYRIGHT_NAME,
     COPYRIGHT_OWNER_URI,
@@ -38,8 +42,12 @@ from ..constants import (
     DEBUG_VARIABLE_DICTIONARIES,
     DESIGN_NAMES_BY_PAGE_ID,
     INTERVAL_UNIT_NAMES,
+    MAXIMUM_QUEUE_LENGTH,
     PACKAGE_MANAGER_NAMES,
     PRINTER_NAMES,
+    RETRY_BACKOFF_TEXT,
+    SHA256_PATTERN,
+    SIZE_UNIT_NAMES,
     STEP_NAMES,
     STYLE_ROUTE,
     VARIABLE_ID_PATTERN,
@@ -50,7 +58,7 @@ from ..exceptions import (
     CrossComputeConfigurationNotImplementedError,
     CrossComputeError)
 from ..macros.iterable import find_item
-from ..macros.package import is_equivalent_version
+from ..macros.package import get_module_path, is_equivalent_version
 from ..settings import (
     printer_by_name,
     view_by_name)
@@ -237,6 +245,23 @@ class ScriptDefinition(Definition):
             return
         return f'python3 "{script_path}"'
 
+    def get_source_paths(self):
+        automation_folder = self.automation_folder
+        if self.command:
+            source_paths = []
+            for term in shlex.split(self.command):
+                path = automation_folder / self.folder / term
+                if path.exists():
+                    source_paths.append(path)
+            return source_paths
+        if self.path:
+            return [automation_folder / self.folder / self.path]
+        if 'function' in self:
+            path = get_module_path(
+                automation_folder / self.folder, self['function'])
+            return [path] if path.exists() else []
+        return []
+
 
 class PackageDefinition(Definition):
 
@@ -538,11 +563,37 @@ def validate_environment(configuration):
     environment_variable_ids = get_environment_variable_ids(get_dictionaries(
         d, 'variables'))
     batch_concurrency_name = d.get('batch', 'thread').lower()
-    if batch_concurrency_name not in ('process', 'thread', 'single'):
+    if batch_concurrency_name not in ('process', 'thread', 'single', 'vector'):
         raise CrossComputeConfigurationError(
             f'batch concurrency "{batch_concurrency_name}" is not supported')
+    batch_chunk_size = get_positive_integer(d, 'chunk', BATCH_CHUNK_SIZE)
     interval_timedelta, is_interval_strict = get_interval_pack(d.get(
         'interval', '').strip())
+    pool_dictionary = get_dictionary(d, 'pool')
+    container_pool_size = get_positive_integer(
+        pool_dictionary, 'size', cpu_count())
+    container_idle_timedelta = get_interval_pack(str(pool_dictionary.get(
+        'idle', CONTAINER_IDLE_TEXT)).strip())[0]
+    timeout_timedelta = get_interval_pack(str(d.get(
+        'timeout', '')).strip())[0]
+    script_worker_count = get_positive_integer(d, 'parallel', cpu_count())
+    queue_dictionary = get_dictionary(d, 'queue')
+    queue_size = get_positive_integer(queue_dictionary, 'size', cpu_count())
+    queue_length = get_positive_integer(
+        queue_dictionary, 'length', MAXIMUM_QUEUE_LENGTH)
+    queue_weight = get_positive_integer(queue_dictionary, 'weight', 1)
+    limit_by_name = get_limit_by_name(get_dictionary(d, 'limits'))
+    retry_dictionary = get_dictionary(d, 'retry')
+    retry_attempt_count = get_positive_integer(
+        retry_dictionary, 'attempts', 1)
+    retry_backoff_timedelta = get_interval_pack(str(retry_dictionary.get(
+        'backoff', RETRY_BACKOFF_TEXT)).strip())[0]
+    retry_return_codes = get_return_codes(retry_dictionary)
+    with_cache = bool(d.get('cache', False))
+    podman_userns_name = d.get('userns', 'chown').strip()
+    if podman_userns_name not in ('keep-id', 'chown'):
+        raise CrossComputeConfigurationError(
+            f'userns "{podman_userns_name}" is not supported')
     return {
         'engine_name': get_engine_name(d),
         'parent_image_name': d.get('image', 'python').strip(),
@@ -550,8 +601,23 @@ def validate_environment(configuration):
         'port_definitions': port_definitions,
         'environment_variable_ids': environment_variable_ids,
         'batch_concurrency_name': batch_concurrency_name,
+        'batch_chunk_size': batch_chunk_size,
         'interval_timedelta': interval_timedelta,
-        'is_interval_strict': is_interval_strict}
+        'is_interval_strict': is_interval_strict,
+        'container_pool_size': container_pool_size,
+        'container_idle_timedelta': container_idle_timedelta,
+        'podman_userns_name': podman_userns_name,
+        'timeout_timedelta': timeout_timedelta,
+        'script_worker_count': script_worker_count,
+        'queue_size': queue_size,
+        'queue_length': queue_length,
+        'queue_weight': queue_weight,
+        'limit_by_name': limit_by_name,
+        'retry_attempt_count': retry_attempt_count,
+        'retry_backoff_timedelta': retry_backoff_timedelta,
+        'retry_return_codes': retry_return_codes,
+        'with_cache': with_cache,
+        'with_digest': with_cache}
 
 
 def validate_datasets(configuration):
@@ -559,7 +625,9 @@ def validate_datasets(configuration):
     dataset_definitions = [DatasetDefinition(
         _, automation_folder=automation_folder,
     ) for _ in get_dictionaries(configuration, 'datasets')]
-    return {'dataset_definitions': dataset_definitions}
+    return {
+        'dataset_definitions': dataset_definitions,
+        'dataset_digest_by_path': {}}
 
 
 def validate_scripts(configuration):
@@ -567,6 +635,23 @@ def validate_scripts(configuration):
     script_definitions = [ScriptDefinition(
         _, automation_folder=automation_folder,
     ) for _ in get_dictionaries(configuration, 'scripts')]
+    assert_unique_values([
+        _.id for _ in script_definitions if _.id], 'script id "{x}"')
+    index_by_id = {
+        _.id: i for i, _ in enumerate(script_definitions) if _.id}
+    for index, script_definition in enumerate(script_definitions):
+        after_ids = script_definition.after_ids
+        if after_ids is None:
+            # Scripts without after run after the previous script
+            dependency_indices = [index - 1] if index else []
+        else:
+            try:
+                dependency_indices = [index_by_id[_] for _ in after_ids]
+            except KeyError as e:
+                raise CrossComputeConfigurationError(
+                    f'script after {e} does not match a script id')
+        script_definition.dependency_indices = dependency_indices
+    get_script_levels(script_definitions)
     return {'script_definitions': script_definitions}
 
 
@@ -770,7 +855,13 @@ def validate_batch_configuration(batch_dictionary):
 
 
 def validate_dataset_identifiers(dataset_dictionary):
-    return {'path': get_folder_plus_path(dataset_dictionary)}
+    mode_name = dataset_dictionary.get('mode', 'mount').strip()
+    if mode_name not in ('mount', 'copy'):
+        raise CrossComputeConfigurationError(
+            f'dataset mode "{mode_name}" is not supported')
+    return {
+        'path': get_folder_plus_path(dataset_dictionary),
+        'mode_name': mode_name}
 
 
 def validate_dataset_reference(dataset_dictionary):
@@ -795,7 +886,17 @@ def validate_dataset_reference(dataset_dictionary):
             raise CrossComputeConfigurationError(
                 'dataset path conflicts with existing dataset; please delete '
                 f'"{target_path}" from the disk to continue')
-    return {'reference': dataset_reference}
+    max_age_timedelta = get_interval_pack(str(dataset_reference.get(
+        'max_age', '')).strip())[0]
+    sha256_digest = str(dataset_reference.get('sha256', '')).strip().lower()
+    if sha256_digest and not SHA256_PATTERN.match(sha256_digest):
+        raise CrossComputeConfigurationError(
+            f'dataset reference sha256 "{sha256_digest}" is not valid')
+    return {
+        'reference': dataset_reference,
+        'max_age_in_seconds': max_age_timedelta.total_seconds() if
+        max_age_timedelta else 0,
+        'sha256_digest': sha256_digest or None}
 
 
 def validate_script_identifiers(script_dictionary):
@@ -824,7 +925,18 @@ def validate_script_identifiers(script_dictionary):
     if method_count > 1:
         raise CrossComputeConfigurationError(
             'script command or path or function is required')
-    return {'folder': Path(folder), 'command': command, 'path': path}
+
+    script_id = str(script_dictionary.get('id', '')).strip()
+    if 'after' in script_dictionary:
+        after_ids = script_dictionary['after']
+        if not isinstance(after_ids, list):
+            after_ids = [after_ids]
+        after_ids = [str(_).strip() for _ in after_ids]
+    else:
+        after_ids = None
+    return {
+        'folder': Path(folder), 'command': command, 'path': path,
+        'id': script_id, 'after_ids': after_ids}
 
 
 def validate_package_identifiers(package_dictionary):
@@ -989,9 +1101,10 @@ def get_engine_name(environment_dictionary):
     if engine_name == 'podman':
         if not shutil.which('podman'):
             L.warning('podman is not available on this machine')
-    elif engine_name == 'unsafe':
+    elif engine_name in ('unsafe', 'warm'):
         L.warning(
-            'using engine=unsafe; use engine=podman for untrusted code')
+            f'using engine={engine_name}; '
+            'use engine=podman for untrusted code')
     else:
         raise CrossComputeConfigurationError(
             f'engine "{engine_name}" is not supported')
@@ -1061,6 +1174,96 @@ def get_interval_pack(interval_text):
     return timedelta(**{unit_name: count}), is_strict
 
 
+def get_script_levels(script_definitions):
+    level_by_index = {}
+    while len(level_by_index) < len(script_definitions):
+        old_count = len(level_by_index)
+        for index, script_definition in enumerate(script_definitions):
+            if index in level_by_index:
+                continue
+            dependency_indices = script_definition.dependency_indices
+            if all(_ in level_by_index for _ in dependency_indices):
+                level_by_index[index] = max((
+                    level_by_index[_] + 1 for _ in dependency_indices),
+                    default=0)
+        if len(level_by_index) == old_count:
+            raise CrossComputeConfigurationError(
+                'script after has a cycle')
+    indices_by_level = defaultdict(list)
+    for index, level in sorted(level_by_index.items()):
+        indices_by_level[level].append(index)
+    return [indices_by_level[_] for _ in sorted(indices_by_level)]
+
+
+def get_limit_by_name(d):
+    limit_by_name = {}
+    if 'memory' in d:
+        limit_by_name['memory'] = get_size_in_bytes(str(d['memory']).strip())
+    if 'cpus' in d:
+        try:
+            cpus = float(d['cpus'])
+        except (TypeError, ValueError):
+            cpus = 0
+        if cpus <= 0:
+            raise CrossComputeConfigurationError(
+                '"cpus" must be a positive number')
+        limit_by_name['cpus'] = cpus
+    if 'time' in d:
+        time_timedelta = get_interval_pack(str(d['time']).strip())[0]
+        if time_timedelta:
+            limit_by_name['time'] = ceil(time_timedelta.total_seconds())
+    if 'files' in d:
+        limit_by_name['files'] = get_positive_integer(d, 'files', None)
+    return limit_by_name
+
+
+def get_return_codes(d):
+    if 'codes' not in d:
+        return
+    return_codes = d['codes']
+    if not isinstance(return_codes, list):
+        return_codes = [return_codes]
+    try:
+        return [int(_) for _ in return_codes]
+    except (TypeError, ValueError):
+        raise CrossComputeConfigurationError(
+            '"codes" must be a list of integers')
+
+
+def get_size_in_bytes(size_text):
+    try:
+        count, name = (size_text.split(maxsplit=1) + ['B'])[:2]
+        count = float(count)
+    except ValueError:
+        raise CrossComputeConfigurationError(
+            f'size "{size_text}" is not parsable; '
+            f'something like "2 GB" was expected')
+    try:
+        unit_index = SIZE_UNIT_NAMES.index(name.upper())
+    except ValueError:
+        unit_names_text = ' or '.join(SIZE_UNIT_NAMES)
+        raise CrossComputeConfigurationError(
+            f'size "{size_text}" unit "{name}" is not supported; '
+            f'{unit_names_text} was expected')
+    size_in_bytes = int(count * 1024 ** unit_index)
+    if size_in_bytes < 1:
+        raise CrossComputeConfigurationError(
+            f'size "{size_text}" must be positive')
+    return size_in_bytes
+
+
+def get_positive_integer(d, key, default):
+    value = d.get(key, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = 0
+    if value < 1:
+        raise CrossComputeConfigurationError(
+            f'"{key}" must be a positive integer')
+    return value
+
+
 def get_scalar_text(d, key, default=None):
     value = d.get(key) or default
     if value is None:
@@ -1,4 +1,3 @@
-import shlex
 from copy import deepcopy
 from logging import getLogger
 from os.path import isfile
@@ -11,7 +10,7 @@ from watchfiles import Change, DefaultFilter
 from ..constants import (
     Info,
     BATCH_ROUTE,
-    MAXIMUM_FILE_CACHE_LENGTH,
+    FILE_CACHE_SIZE_IN_BYTES,
     STEP_CODE_BY_NAME,
     STEP_ROUTE)
 from ..exceptions import CrossComputeDataError
@@ -156,26 +155,11 @@ def add_script_infos(memory, configuration):
     info = {'code': Info.SCRIPT}
     for automation_definition in configuration.automation_definitions:
         automation_uri = automation_definition.uri
-        automation_folder = automation_definition.folder
         for i, script_definition in enumerate(
                 automation_definition.script_definitions):
             script_info = info | {'index': i, 'uri': automation_uri}
-            if 'command' in script_definition:
-                for term in shlex.split(script_definition.command):
-                    file_path = automation_folder / term
-                    if file_path.exists():
-                        memory.add(file_path, script_info)
-                continue
-            if 'path' in script_definition:
-                file_path = automation_folder / script_definition.path
+            for file_path in script_definition.get_source_paths():
                 memory.add(file_path, script_info)
-                continue
-            if 'function' in script_definition:
-                module_name = script_definition['function'].split('.')[0]
-                file_name = module_name + '.py'
-                file_path = automation_folder / file_name
-                if file_path.exists():
-                    memory.add(file_path, script_info)
 
 
 def add_dataset_infos(memory, configuration):
@@ -266,5 +250,5 @@ def add_style_infos(memory, configuration):
 
 FILE_JSON_CACHE = FileCache(
     load_file_data=load_file_json,
-    maximum_length=MAXIMUM_FILE_CACHE_LENGTH)
+    maximum_size_in_bytes=FILE_CACHE_SIZE_IN_BYTES)
 L = getLogger(__name__)
@@ -0,0 +1,276 @@
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hashlib import sha256
+from logging import getLogger
+from os import close, link, replace, utime
+from pathlib import Path
+from shutil import copyfile
+from tempfile import mkstemp
+from time import time
+from urllib.error import URLError
+from urllib.request import urlretrieve
+
+import requests
+
+from ..constants import (
+    BLOBS_FOLDER,
+    DATASETS_FOLDER,
+    DOWNLOAD_CHUNK_SIZE_IN_BYTES,
+    DOWNLOAD_TIMEOUT_IN_SECONDS,
+    TEMPORARY_FILE_AGE_IN_SECONDS)
+from ..exceptions import (
+    CrossComputeDataError)
+
+
+def download_datasets(uri_packs):
+    if not uri_packs:
+        return
+    BLOBS_FOLDER.mkdir(parents=True, exist_ok=True)
+    with requests.Session() as session, ThreadPoolExecutor() as executor:
+        futures = [executor.submit(
+            download_dataset, session, *_) for _ in uri_packs]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except CrossComputeDataError as e:
+                L.error(e)
+
+
+def download_dataset(
+        session, uri, target_path, max_age_in_seconds=0, digest=None):
+    meta_path = get_meta_path(uri)
+    meta = load_meta(meta_path)
+    if meta and not is_blob_ready(meta):
+        meta = {}
+    if not meta or time() - meta['time'] >= max_age_in_seconds:
+        try:
+            if uri.startswith('http://') or uri.startswith('https://'):
+                meta = fetch_dataset(session, uri, meta)
+            else:
+                meta = retrieve_dataset(uri)
+        except CrossComputeDataError as e:
+            if not meta:
+                raise
+            L.warning('%s; using cached copy', e)
+    if digest and meta['digest'] != digest:
+        raise CrossComputeDataError(
+            f'dataset from {uri} has sha256 {meta["digest"]} instead of '
+            f'{digest}')
+    materialize_dataset(meta['digest'], target_path)
+    # Remember the verified blob and its targets for later checks
+    meta['stat'] = get_blob_stat(get_blob_path(meta['digest']))
+    meta['paths'] = sorted(set(meta.get('paths', [])) | {str(target_path)})
+    save_meta(meta_path, meta)
+    return target_path
+
+
+def fetch_dataset(session, uri, meta):
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        with session.get(
+                uri, headers=headers, stream=True,
+                timeout=DOWNLOAD_TIMEOUT_IN_SECONDS) as response:
+            if response.status_code == 304:
+                L.debug('%s is not modified', uri)
+                return meta | {'time': time()}
+            response.raise_for_status()
+            digest = save_blob(response.iter_content(
+                DOWNLOAD_CHUNK_SIZE_IN_BYTES))
+            response_headers = response.headers
+    except requests.RequestException as e:
+        raise CrossComputeDataError(
+            f'could not download dataset from {uri}; {e}')
+    L.info('downloaded dataset from %s', uri)
+    return {
+        'uri': uri,
+        'etag': response_headers.get('ETag'),
+        'last_modified': response_headers.get('Last-Modified'),
+        'digest': digest,
+        'time': time()}
+
+
+def retrieve_dataset(uri):
+    temporary_path = make_temporary_path(BLOBS_FOLDER)
+    try:
+        urlretrieve(uri, temporary_path)
+        with temporary_path.open('rb') as f:
+            digest = save_blob(iter(
+                lambda: f.read(DOWNLOAD_CHUNK_SIZE_IN_BYTES), b''))
+    except (URLError, ValueError) as e:
+        raise CrossComputeDataError(
+            f'could not download dataset from {uri}; {e}')
+    finally:
+        temporary_path.unlink(missing_ok=True)
+    return {'uri': uri, 'digest': digest, 'time': time()}
+
+
+def save_blob(chunks):
+    h = sha256()
+    temporary_path = make_temporary_path(BLOBS_FOLDER)
+    try:
+        with temporary_path.open('wb') as f:
+            for chunk in chunks:
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        blob_path = get_blob_path(digest)
+        # Discourage writes through hardlinks; is_blob_ready catches the rest
+        temporary_path.chmod(0o444)
+        try:
+            # Link instead of replace so that existing blobs keep their inode
+            link(temporary_path, blob_path)
+        except FileExistsError:
+            if get_file_digest(blob_path) == digest:
+                # Refresh the time that collect_garbage uses to rank blobs
+                utime(blob_path)
+            else:
+                replace(temporary_path, blob_path)
+    finally:
+        temporary_path.unlink(missing_ok=True)
+    return digest
+
+
+def is_blob_ready(meta):
+    digest = meta['digest']
+    blob_path = get_blob_path(digest)
+    try:
+        # Skip the checksum if nothing wrote to the blob since the last check
+        if meta.get('stat') == get_blob_stat(blob_path):
+            return True
+        if get_file_digest(blob_path) == digest:
+            return True
+    except OSError:
+        return False
+    L.warning('removing corrupted dataset blob %s', digest)
+    blob_path.unlink(missing_ok=True)
+    return False
+
+
+def materialize_dataset(digest, target_path):
+    blob_path = get_blob_path(digest)
+    if is_same_file(blob_path, target_path):
+        return target_path
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    # Link next to the target so that scripts never see a partial file
+    temporary_path = make_temporary_path(target_path.parent)
+    try:
+        temporary_path.unlink()
+        try:
+            link(blob_path, temporary_path)
+        except OSError:
+            # Copy when the cache is on a different device
+            copyfile(blob_path, temporary_path)
+            blob_stat = blob_path.stat()
+            utime(temporary_path, ns=(
+                blob_stat.st_atime_ns, blob_stat.st_mtime_ns))
+        replace(temporary_path, target_path)
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+    return target_path
+
+
+def collect_garbage(budget_in_bytes=0):
+    referenced_digests = set()
+    for meta_path in DATASETS_FOLDER.glob('*.json'):
+        meta = load_meta(meta_path)
+        if not meta:
+            continue
+        blob_path = get_blob_path(meta['digest'])
+        # Keep blobs whose hardlinks or copies are still in place
+        paths = [_ for _ in meta.get('paths', []) if is_same_file(
+            blob_path, Path(_))]
+        if paths:
+            referenced_digests.add(meta['digest'])
+        if paths != meta.get('paths', []):
+            save_meta(meta_path, meta | {'paths': paths})
+    blob_packs, total_size = [], 0
+    for path in BLOBS_FOLDER.glob('*'):
+        path_stat = path.stat()
+        if path.name.startswith('.'):
+            # Remove temporary files that were left by interrupted downloads
+            if time() - path_stat.st_mtime > TEMPORARY_FILE_AGE_IN_SECONDS:
+                path.unlink(missing_ok=True)
+            continue
+        total_size += path_stat.st_size
+        if path_stat.st_nlink > 1 or path.name in referenced_digests:
+            continue
+        blob_packs.append((path_stat.st_mtime, path_stat.st_size, path))
+    removed_count, removed_size = 0, 0
+    for _, blob_size, blob_path in sorted(blob_packs):
+        if total_size <= budget_in_bytes:
+            break
+        blob_path.unlink(missing_ok=True)
+        total_size -= blob_size
+        removed_count += 1
+        removed_size += blob_size
+    for meta_path in DATASETS_FOLDER.glob('*.json'):
+        meta = load_meta(meta_path)
+        if not meta or not get_blob_path(meta['digest']).exists():
+            meta_path.unlink(missing_ok=True)
+    return removed_count, removed_size
+
+
+def get_meta_path(uri):
+    return DATASETS_FOLDER / (sha256(uri.encode()).hexdigest() + '.json')
+
+
+def get_blob_path(digest):
+    return BLOBS_FOLDER / digest
+
+
+def get_blob_stat(path):
+    path_stat = path.stat()
+    return [path_stat.st_ino, path_stat.st_size, path_stat.st_mtime_ns]
+
+
+def get_file_digest(path):
+    h = sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE_IN_BYTES), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_same_file(source_path, target_path):
+    try:
+        source_stat = source_path.stat()
+        target_stat = target_path.stat()
+    except OSError:
+        return False
+    if target_path.is_symlink():
+        return False
+    if (source_stat.st_dev, source_stat.st_ino) == (
+            target_stat.st_dev, target_stat.st_ino):
+        return True
+    # Match copies by size and modification time
+    return (source_stat.st_size, source_stat.st_mtime_ns) == (
+        target_stat.st_size, target_stat.st_mtime_ns)
+
+
+def make_temporary_path(folder):
+    file_descriptor, temporary_path = mkstemp(prefix='.', dir=folder)
+    close(file_descriptor)
+    return Path(temporary_path)
+
+
+def load_meta(path):
+    try:
+        with path.open('rt') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_meta(path, meta):
+    temporary_path = make_temporary_path(path.parent)
+    with temporary_path.open('wt') as f:
+        json.dump(meta, f)
+    replace(temporary_path, path)
+
+
+L = getLogger(__name__)
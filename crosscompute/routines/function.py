@@ -0,0 +1,211 @@
+import os
+import sys
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from inspect import signature
+from logging import getLogger
+from multiprocessing import parent_process
+from multiprocessing.util import Finalize
+from os.path import getmtime
+from pathlib import Path
+from queue import Queue
+from resource import RUSAGE_SELF, getrusage
+from site import addsitedir
+from threading import Lock
+from traceback import format_exc, print_exc
+
+from ..macros.package import get_module_path, import_attribute
+from ..macros.resource import get_usage_by_name, reset_maximum_memory
+from ..settings import multiprocessing_context
+
+
+class FunctionPool():
+
+    def __init__(
+            self, folder, function_string, worker_count, site_folder=None):
+        self.folder = folder
+        self.function_string = function_string
+        self.site_folder = site_folder
+        self.module_time = get_module_time(folder, function_string)
+        self._idle_workers = Queue()
+        self._workers = []
+        for i in range(worker_count):
+            self._idle_workers.put(self._start_worker())
+        # Stop workers before multiprocessing joins child processes on exit
+        Finalize(self, self.stop, exitpriority=10)
+
+    def run(
+            self, step_folder_by_name, environment, o_path, e_path,
+            batch_signal=None):
+        worker = self._idle_workers.get()
+        process, connection = worker
+        try:
+            connection.send((
+                step_folder_by_name, environment, str(o_path), str(e_path)))
+            with batch_signal.watch(
+                    process.kill) if batch_signal else nullcontext():
+                return_code, usage_by_name = connection.recv()
+            if batch_signal:
+                batch_signal.record(usage_by_name)
+        except (EOFError, OSError):
+            process.join()
+            return_code = process.exitcode
+            L.warning(
+                '%s worker %s exited with %s', self.function_string,
+                process.pid, return_code)
+            worker = self._replace_worker(worker)
+        finally:
+            self._idle_workers.put(worker)
+        return return_code
+
+    def stop(self):
+        for process, connection in self._workers:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process, connection in self._workers:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+    def _start_worker(self):
+        parent_connection, child_connection = multiprocessing_context.Pipe()
+        process = multiprocessing_context.Process(
+            name='function', target=work, args=(
+                child_connection, self.folder, self.function_string,
+                self.site_folder))
+        process.start()
+        child_connection.close()
+        worker = process, parent_connection
+        self._workers.append(worker)
+        return worker
+
+    def _replace_worker(self, worker):
+        self._workers.remove(worker)
+        worker[1].close()
+        return self._start_worker()
+
+
+def get_function_pool(script_definition, worker_count, site_folder=None):
+    folder = script_definition.automation_folder / script_definition.folder
+    function_string = script_definition['function']
+    key = str(folder), function_string
+    with FUNCTION_POOL_LOCK:
+        function_pool = FUNCTION_POOL_BY_KEY.get(key)
+        if function_pool:
+            module_time = get_module_time(folder, function_string)
+            if function_pool.module_time == module_time and (
+                    function_pool.site_folder == site_folder):
+                return function_pool
+            L.info('restarting %s workers', function_string)
+            function_pool.stop()
+        function_pool = FUNCTION_POOL_BY_KEY[key] = FunctionPool(
+            folder, function_string, worker_count, site_folder)
+    return function_pool
+
+
+def forget_function_pools():
+    # Start new workers in forked children instead of sharing their pipes
+    global FUNCTION_POOL_LOCK
+    FUNCTION_POOL_BY_KEY.clear()
+    FUNCTION_POOL_LOCK = Lock()
+
+
+def get_module_time(folder, function_string):
+    try:
+        return getmtime(get_module_path(folder, function_string))
+    except OSError:
+        return 0
+
+
+def work(connection, folder, function_string, site_folder=None):
+    os.chdir(folder)
+    if site_folder:
+        # Prefer packages from the automation environment to our own
+        old_paths = sys.path[:]
+        addsitedir(str(site_folder))
+        sys.path[:] = [_ for _ in sys.path if _ not in old_paths] + old_paths
+    sys.path.insert(0, str(folder))
+    try:
+        f = import_attribute(function_string)
+        parameter_names = list(signature(f).parameters)
+    except Exception:
+        f, error_text = None, format_exc()
+    parent = parent_process()
+    while parent.is_alive():
+        if not connection.poll(1):
+            continue
+        try:
+            pack = connection.recv()
+        except EOFError:
+            break
+        if pack is None:
+            break
+        step_folder_by_name, environment, o_path, e_path = pack
+        is_reset = reset_maximum_memory()
+        old_rusage = getrusage(RUSAGE_SELF)
+        if f:
+            return_code = call_function(
+                f, parameter_names, step_folder_by_name, environment,
+                o_path, e_path)
+        else:
+            with open(e_path, 'at') as e_file:
+                e_file.write(error_text)
+            return_code = 1
+        usage_by_name = get_usage_by_name(getrusage(RUSAGE_SELF), old_rusage)
+        if not is_reset:
+            # Label the peak because it covers every batch of this worker
+            usage_by_name['maximum_lifetime_memory_in_bytes'] = \
+                usage_by_name.pop('maximum_memory_in_bytes')
+        connection.send((return_code, usage_by_name))
+
+
+def call_function(
+        f, parameter_names, step_folder_by_name, environment, o_path, e_path):
+    os.environ.clear()
+    os.environ.update({k: str(v) for k, v in environment.items()})
+    d = {
+        k: Path(v) for k, v in step_folder_by_name.items()
+        if k in parameter_names}
+    sys.stdout.flush()
+    sys.stderr.flush()
+    old_descriptors = os.dup(1), os.dup(2)
+    with open(o_path, 'at', buffering=1) as o_file, open(
+            e_path, 'at', buffering=1) as e_file:
+        os.dup2(o_file.fileno(), 1)
+        os.dup2(e_file.fileno(), 2)
+        try:
+            with redirect_stdout(o_file), redirect_stderr(e_file):
+                f(**d)
+        except SystemExit as e:
+            return_code = get_exit_code(e, e_file)
+        except Exception:
+            print_exc(file=e_file)
+            return_code = 1
+        else:
+            return_code = 0
+        finally:
+            o_file.flush()
+            e_file.flush()
+            for old_descriptor, descriptor in zip(old_descriptors, (1, 2)):
+                os.dup2(old_descriptor, descriptor)
+                os.close(old_descriptor)
+    return return_code
+
+
+def get_exit_code(e, e_file):
+    code = e.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=e_file)
+    return 1
+
+
+FUNCTION_POOL_BY_KEY = {}
+FUNCTION_POOL_LOCK = Lock()
+os.register_at_fork(after_in_child=forget_function_pools)
+L = getLogger(__name__)
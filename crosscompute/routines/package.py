@@ -0,0 +1,129 @@
+import subprocess
+import sys
+from contextlib import contextmanager
+from fcntl import LOCK_EX, flock
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from shutil import rmtree
+
+from ..constants import (
+    ENVIRONMENTS_FOLDER)
+from ..exceptions import (
+    CrossComputeExecutionError)
+from .cache import (
+    get_json_bytes)
+
+
+def prepare_package_folder(package_ids_by_manager_name):
+    if not package_ids_by_manager_name:
+        return
+    system_manager_names = set(package_ids_by_manager_name).intersection(
+        SYSTEM_MANAGER_NAMES)
+    if system_manager_names:
+        with hold_lock(ENVIRONMENTS_FOLDER / SYSTEM_LOCK_NAME):
+            try:
+                install_system_packages(package_ids_by_manager_name)
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise CrossComputeExecutionError(
+                    'could not install packages: %s' % e)
+        if len(system_manager_names) == len(package_ids_by_manager_name):
+            return
+    package_folder = get_package_folder(package_ids_by_manager_name)
+    done_path = package_folder / DONE_NAME
+    with hold_lock(package_folder.with_suffix(LOCK_SUFFIX)):
+        if done_path.exists():
+            L.info('using packages in %s', package_folder)
+            return package_folder
+        # Start over if a previous installation was interrupted
+        rmtree(package_folder, ignore_errors=True)
+        package_folder.mkdir(parents=True)
+        try:
+            install_packages(package_folder, package_ids_by_manager_name)
+        except (OSError, subprocess.CalledProcessError) as e:
+            rmtree(package_folder, ignore_errors=True)
+            raise CrossComputeExecutionError(
+                'could not install packages: %s' % e)
+        done_path.touch()
+    return package_folder
+
+
+def install_system_packages(package_ids_by_manager_name):
+    for manager_name, terms in SYSTEM_CHECK_TERMS_BY_MANAGER_NAME.items():
+        package_ids = sorted(package_ids_by_manager_name.get(
+            manager_name, []))
+        if not package_ids:
+            continue
+        # Check every time because system packages can be removed later
+        try:
+            if subprocess.run(
+                    terms + package_ids,
+                    capture_output=True).returncode == 0:
+                continue
+        except OSError:
+            pass
+        subprocess.run([manager_name, 'install'] + package_ids, check=True)
+
+
+def install_packages(package_folder, package_ids_by_manager_name):
+    for manager_name, package_ids in package_ids_by_manager_name.items():
+        package_ids = sorted(package_ids)
+        if manager_name in SYSTEM_MANAGER_NAMES:
+            continue
+        if manager_name == 'pip':
+            subprocess.run([
+                sys.executable, '-m', 'venv', package_folder], check=True)
+            subprocess.run([
+                package_folder / 'bin' / 'pip', 'install'] + package_ids,
+                check=True)
+        elif manager_name == 'npm':
+            subprocess.run([
+                'npm', 'install', '--prefix', package_folder] + package_ids,
+                check=True)
+
+
+def get_package_environment(package_ids_by_manager_name, path_text):
+    if not package_ids_by_manager_name:
+        return {}
+    package_folder = get_package_folder(package_ids_by_manager_name)
+    d, folders = {}, []
+    if 'pip' in package_ids_by_manager_name:
+        d['VIRTUAL_ENV'] = str(package_folder)
+        folders.append(package_folder / 'bin')
+    if 'npm' in package_ids_by_manager_name:
+        d['NODE_PATH'] = str(package_folder / 'node_modules')
+        folders.append(package_folder / 'node_modules' / '.bin')
+    if folders:
+        d['PATH'] = ':'.join([str(_) for _ in folders] + [path_text])
+    return d
+
+
+def get_site_folder(package_folder):
+    python_name = 'python%s.%s' % sys.version_info[:2]
+    return Path(package_folder) / 'lib' / python_name / 'site-packages'
+
+
+def get_package_folder(package_ids_by_manager_name):
+    package_digest = sha256(get_json_bytes({
+        k: sorted(v) for k, v in package_ids_by_manager_name.items()
+    })).hexdigest()
+    return ENVIRONMENTS_FOLDER / package_digest
+
+
+@contextmanager
+def hold_lock(path):
+    # Use a file lock so that separate processes take turns too
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('w') as f:
+        flock(f, LOCK_EX)
+        yield
+
+
+DONE_NAME = '.done'
+LOCK_SUFFIX = '.lock'
+SYSTEM_LOCK_NAME = 'system.lock'
+SYSTEM_CHECK_TERMS_BY_MANAGER_NAME = {
+    'apt': ['dpkg', '-s'],
+    'dnf': ['rpm', '-q']}
+SYSTEM_MANAGER_NAMES = list(SYSTEM_CHECK_TERMS_BY_MANAGER_NAME)
+L = getLogger(__name__)
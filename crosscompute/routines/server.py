@@ -2,6 +2,7 @@ import asyncio
 from contextlib import asynccontextmanager
 from logging import getLogger, DEBUG
 from os import getenv
+from threading import Thread
 from time import time
 
 import uvicorn
@@ -30,22 +31,26 @@ from ..routers import (
     token)
 from ..settings import (
     StoppableProcess,
+    multiprocessing_context,
     site,
     template_environment,
     template_globals,
     template_path_by_id)
 from .database import (
+    FILE_JSON_CACHE,
     DiskDatabase,
     PositiveFileFilter)
 from .interface import (
     Server)
+from .variable import (
+    FILE_DATA_CACHE)
 
 
 class DiskServer(Server):
 
     def __init__(
             self, work, environment, safe,
-            uris, tasks, changes,
+            uris, tasks, changes, wakeup, queues,
             host=HOST, port=PORT, root_uri='', allowed_origins=None,
             with_restart=True, with_prefix=True, with_hidden=True):
         self._work = work
@@ -54,6 +59,8 @@ class DiskServer(Server):
         self._uris = uris
         self._tasks = tasks
         self._changes = changes
+        self._wakeup = wakeup
+        self._queues = queues
         self._host = host
         self._port = port
         self._root_uri = root_uri
@@ -74,6 +81,8 @@ class DiskServer(Server):
                 CORSMiddleware, allow_origins=allowed_origins,
                 allow_credentials=True, allow_methods=['*'],
                 allow_headers=['*'])
+        Thread(target=invalidate_caches, args=(
+            self._path_queue, [configuration.folder]), daemon=True).start()
         L.info('serving at http://%s:%s%s', host, port, root_uri)
         try:
             uvicorn.run(
@@ -89,13 +98,19 @@ class DiskServer(Server):
     def watch(self, configuration, reload):
         s_process, w_process, d_database = self.start(configuration)
         try:
+            positive_file_filter = PositiveFileFilter()
             for changed_packs in watch(
-                    configuration.folder,
-                    watch_filter=PositiveFileFilter(),
+                    configuration.folder, watch_filter=None,
                     debounce=DISK_DEBOUNCE_IN_MILLISECONDS,
                     step=DISK_STEP_IN_MILLISECONDS):
-                changed_paths = [_[1] for _ in changed_packs]
+                # Send every change so that the server drops stale cached files
+                self._path_queue.put([_[1] for _ in changed_packs])
+                changed_paths = [
+                    path for change, path in changed_packs
+                    if positive_file_filter(change, path)]
                 changed_infos = d_database.grok(changed_paths)
+                if changed_infos:
+                    self._wakeup.set()
                 should_restart_server = False
                 for info in changed_infos:
                     if info['code'] == Info.CONFIGURATION:
@@ -120,6 +135,7 @@ class DiskServer(Server):
 
     def start(self, configuration):
         self.refresh(configuration)
+        self._path_queue = multiprocessing_context.Queue()
         server_process = StoppableProcess(
             name='server', target=self.serve,
             args=(configuration,))
@@ -131,6 +147,8 @@ class DiskServer(Server):
                 self._tasks,
                 self._uris,
                 self._changes,
+                self._wakeup,
+                self._queues,
                 self._environment,
                 f'http://127.0.0.1:{self._port}{self._root_uri}'),
             kwargs={'with_rebuild': True})
@@ -150,6 +168,8 @@ class DiskServer(Server):
             'uris': self._uris,
             'tasks': self._tasks,
             'changes': self._changes,
+            'wakeup': self._wakeup,
+            'queues': self._queues,
             'with_prefix': self._with_prefix,
             'with_hidden': self._with_hidden})
         template_path_by_id.update(TEMPLATE_PATH_BY_ID)
@@ -193,5 +213,21 @@ async def handle_http_exception(request, e):
     return response
 
 
+def invalidate_caches(path_queue, folders):
+    file_caches = FILE_DATA_CACHE, FILE_JSON_CACHE
+    for file_cache in file_caches:
+        file_cache.watch(folders)
+    try:
+        while True:
+            changed_paths = path_queue.get()
+            for file_cache in file_caches:
+                file_cache.invalidate(changed_paths)
+    except (EOFError, OSError):
+        pass
+    finally:
+        for file_cache in file_caches:
+            file_cache.unwatch()
+
+
 L = getLogger(__name__)
 getLogger('uvicorn.error').propagate = False
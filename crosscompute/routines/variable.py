@@ -17,9 +17,9 @@ from invisibleroads_macros_web.escape import (
 
 from ..constants import (
     CACHED_FILE_SIZE_LIMIT_IN_BYTES,
+    FILE_CACHE_SIZE_IN_BYTES,
     FILES_FOLDER,
     FILES_ROUTE,
-    MAXIMUM_FILE_CACHE_LENGTH,
     VARIABLE_ID_TEMPLATE_PATTERN)
 from ..exceptions import (
     CrossComputeConfigurationError,
@@ -28,6 +28,7 @@ from ..exceptions import (
 from ..macros.disk import FileCache
 from ..macros.iterable import find_item
 from ..macros.package import import_attribute
+from ..macros.resource import get_memory_size
 from ..settings import (
     template_globals,
     view_by_name)
@@ -600,10 +601,10 @@ def initialize_view_by_name():
     return view_by_name
 
 
-def save_variable_data(target_path, batch_definition, variable_definitions):
+def save_variable_data(target_path, data_by_id, variable_definitions):
     target_path.parent.mkdir(parents=True, exist_ok=True)
     variable_data_by_id = get_variable_data_by_id(
-        variable_definitions, batch_definition.data_by_id)
+        variable_definitions, data_by_id)
     if target_path.suffix == '.dictionary':
         with target_path.open('wt') as input_file:
             json.dump(get_variable_value_by_id(
@@ -815,6 +816,11 @@ def load_file_data(path):
     return {'path': path}
 
 
+def measure_file_data(file_data):
+    # Count only files whose contents are held in memory
+    return 0 if 'path' in file_data else get_memory_size(file_data)
+
+
 def load_dictionary_data(path):
     try:
         value = load_file_json(path)
@@ -949,5 +955,6 @@ YIELD_DATA_BY_ID_BY_EXTENSION = {
     '.txt': yield_data_by_id_from_txt}
 FILE_DATA_CACHE = FileCache(
     load_file_data=load_file_data,
-    maximum_length=MAXIMUM_FILE_CACHE_LENGTH)
+    measure_file_data=measure_file_data,
+    maximum_size_in_bytes=FILE_CACHE_SIZE_IN_BYTES)
 L = getLogger(__name__)
@@ -1,21 +1,41 @@
 # TODO: Consider giving scripts access to CROSSCOMPUTE_ROOT_URI
+import csv
+import json
 import shlex
 import subprocess
+import tarfile
 from abc import ABC, abstractmethod
 from concurrent.futures import (
-    ProcessPoolExecutor, ThreadPoolExecutor, as_completed)
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed,
+    wait)
+from collections import defaultdict
 from contextlib import contextmanager
+from functools import partial
+from hashlib import sha256
+from heapq import heappop, heappush
+from io import BytesIO
 from logging import getLogger
-from os import environ, getenv, symlink
+from math import ceil
+from os import (
+    cpu_count, environ, getenv, killpg, symlink, wait4,
+    waitstatus_to_exitcode)
+from multiprocessing.managers import BaseManager
+from multiprocessing.util import Finalize
 from os.path import relpath
-from random import choice
-from threading import Thread
+from pathlib import Path
+from queue import Empty, Queue, SimpleQueue
+from resource import (
+    RLIM_INFINITY, RLIMIT_AS, RLIMIT_CPU, RLIMIT_NOFILE, getrlimit)
+from shutil import copy, copytree, rmtree, which
+from signal import SIGKILL
+from tempfile import mkdtemp
+from threading import Condition, Event, Lock, Thread, Timer
 from time import sleep, time
-from urllib.error import URLError
-from urllib.request import urlretrieve as download_uri
 
 import requests
-from invisibleroads_macros_disk import make_folder
+from invisibleroads_macros_disk import make_folder, make_random_folder
+from invisibleroads_macros_log import format_path
+from invisibleroads_macros_security import make_random_string
 from invisibleroads_macros_web.port import find_open_port
 from jinja2 import Template
 
@@ -25,6 +45,10 @@ from ..constants import (
     Task,
     AUTOMATION_ROUTE,
     BATCH_ROUTE,
+    CONTAINERS_FOLDER,
+    COORDINATOR_PORT,
+    HOST,
+    ID_LENGTH,
     MAXIMUM_PORT,
     MINIMUM_PORT,
     PORT_ROUTE,
@@ -36,20 +60,47 @@ from ..exceptions import (
     CrossComputeDataError,
     CrossComputeExecutionError,
     CrossComputeError)
+from ..macros.disk import update_hash
 from ..macros.iterable import find_item, group_by
+from ..macros.resource import (
+    get_folder_size,
+    get_usage_by_name,
+    merge_usage_by_name,
+    SUMMED_USAGE_NAMES,
+    USAGE_NAMES)
+from ..settings import (
+    multiprocessing_context)
+from .cache import (
+    get_batch_digest,
+    get_dataset_digest_by_path,
+    get_json_bytes,
+    restore_batch,
+    save_batch)
+from .dataset import (
+    download_datasets)
 from .configuration import (
-    get_folder_plus_path)
+    get_folder_plus_path,
+    get_script_levels)
+from .function import (
+    get_function_pool)
+from .package import (
+    get_package_environment,
+    get_site_folder,
+    prepare_package_folder)
 from .printer import (
     print_batch)
 from .uri import (
     get_automation_slug,
     get_batch_slug)
 from .variable import (
+    get_data_by_id_from_folder,
     get_variable_data_by_id,
     get_variable_value_by_id,
+    load_file_json,
     process_variable_data,
     save_variable_data,
-    update_variable_data)
+    update_variable_data,
+    yield_data_by_id_from_csv)
 
 
 class AbstractEngine(ABC):
@@ -62,11 +113,14 @@ class AbstractEngine(ABC):
         pass
 
     @abstractmethod
-    def run(self, automation_definition, batch_folder, custom_environment):
+    def run(
+            self, automation_definition, batch_folder, custom_environment,
+            batch_signal):
         pass
 
     def run_batch(
-            self, automation_definition, batch_definition, user_environment):
+            self, automation_definition, batch_definition, user_environment,
+            attempt_count=1):
         reference_time = time()
         batch_folder, batch_environment = prepare_batch(
             automation_definition, batch_definition)
@@ -75,11 +129,112 @@ class AbstractEngine(ABC):
         batch_identifier = ' '.join([
             automation_definition.name, automation_definition.version,
             str(batch_folder)])
+        absolute_batch_folder = automation_definition.folder / batch_folder
+        debug_data_by_id = {'attempt_count': attempt_count}
+        if automation_definition.with_digest:
+            dataset_digest_by_path = (
+                automation_definition.dataset_digest_by_path)
+            batch_digest = get_batch_digest(
+                automation_definition, batch_folder, batch_environment,
+                dataset_digest_by_path)
+            debug_data_by_id.update({
+                'batch_digest': batch_digest,
+                'dataset_digest_by_path': dataset_digest_by_path})
+        if automation_definition.with_cache:
+            is_cache_hit = restore_batch(absolute_batch_folder, batch_digest)
+            debug_data_by_id['is_cache_hit'] = is_cache_hit
+            if is_cache_hit:
+                L.info('%s restored from cache', batch_identifier)
+                return _process_batch(
+                    automation_definition, batch_definition, [
+                        'output', 'log', 'debug',
+                    ], {'debug': debug_data_by_id | dict.fromkeys(
+                        USAGE_NAMES, 0) | {
+                        'output_size_in_bytes': get_folder_size(
+                            absolute_batch_folder / 'output'),
+                        'source_time': reference_time,
+                        'execution_time_in_seconds': time() - reference_time,
+                        'return_code': 0}})
+        return_code, usage_by_name = self.run_signaled(
+            automation_definition, batch_folder,
+            batch_environment | user_environment, batch_identifier)
+        debug_data_by_id.update(usage_by_name)
+        debug_data_by_id['output_size_in_bytes'] = get_folder_size(
+            automation_definition.folder / batch_folder / 'output')
+        variable_data_by_id_by_step_name = _process_batch(
+            automation_definition, batch_definition, [
+                'output', 'log', 'debug',
+            ], {'debug': debug_data_by_id | {
+                'source_time': reference_time,
+                'execution_time_in_seconds': time() - reference_time,
+                'return_code': return_code}})
+        if automation_definition.with_cache and return_code == 0:
+            save_batch(absolute_batch_folder, batch_digest)
+        return variable_data_by_id_by_step_name
+
+    def run_vector(
+            self, automation_definition, batch_definitions, user_environment):
+        reference_time = time()
+        variable_definitions = automation_definition.get_variable_definitions(
+            'input')
+        input_rows, batch_digests = [], []
+        for batch_definition in batch_definitions:
+            batch_folder, batch_environment = prepare_batch(
+                automation_definition, batch_definition)
+            input_rows.append(_get_vector_input_row(
+                automation_definition, batch_definition, batch_environment,
+                variable_definitions))
+            if automation_definition.with_digest:
+                batch_digests.append(get_batch_digest(
+                    automation_definition, batch_folder, batch_environment,
+                    automation_definition.dataset_digest_by_path))
+        if not automation_definition.script_definitions:
+            return []
+        vector_folder = Path(mkdtemp(prefix='crosscompute-vector-'))
+        try:
+            step_folder_by_name = _make_step_folder_by_name(
+                vector_folder, '')
+            input_folder = step_folder_by_name['input_folder']
+            with (input_folder / VECTOR_TABLE_NAME).open('wt') as input_file:
+                csv_writer = csv.writer(input_file)
+                csv_writer.writerow([_.id for _ in variable_definitions])
+                csv_writer.writerows(input_rows)
+            batch_identifier = ' '.join([
+                automation_definition.name, automation_definition.version,
+                f'{len(batch_definitions)} batches'])
+            vector_environment = _prepare_batch_environment(
+                automation_definition, [], {}) | user_environment
+            return_code, usage_by_name = self.run_signaled(
+                automation_definition, vector_folder, vector_environment,
+                batch_identifier)
+            debug_data_by_id = usage_by_name | {
+                'attempt_count': 1,
+                'source_time': reference_time,
+                'execution_time_in_seconds': (
+                    time() - reference_time) / len(batch_definitions),
+                'vector_size': len(batch_definitions)}
+            if automation_definition.with_digest:
+                debug_data_by_id['dataset_digest_by_path'] = (
+                    automation_definition.dataset_digest_by_path)
+            return _split_vector_outputs(
+                automation_definition, batch_definitions, batch_digests,
+                vector_folder, return_code, debug_data_by_id)
+        finally:
+            rmtree(vector_folder, ignore_errors=True)
+
+    def run_signaled(
+            self, automation_definition, batch_folder, custom_environment,
+            batch_identifier):
         L.info('%s running', batch_identifier)
+        batch_signal = BatchSignal(
+            automation_definition.timeout_timedelta,
+            automation_definition.limit_by_name)
+        signal_key = automation_definition.folder / batch_folder
+        BATCH_SIGNAL_BY_FOLDER[signal_key] = batch_signal
         try:
             return_code = self.run(
-                automation_definition, batch_folder,
-                batch_environment | user_environment)
+                automation_definition, batch_folder, custom_environment,
+                batch_signal)
         except CrossComputeConfigurationError as e:
             e.automation_definition = automation_definition
             raise
@@ -89,49 +244,240 @@ class AbstractEngine(ABC):
             L.error('%s failed; %s', batch_identifier, e)
         except KeyboardInterrupt:
             return_code = Error.COMMAND_INTERRUPTED
-            L.error('%s interrupted')
+            L.error('%s interrupted', batch_identifier)
         else:
             L.info('%s done', batch_identifier)
-        return _process_batch(automation_definition, batch_definition, [
-            'output', 'log', 'debug',
-        ], {'debug': {
-            'source_time': reference_time,
-            'execution_time_in_seconds': time() - reference_time,
-            'return_code': return_code}})
+        finally:
+            batch_signal.close()
+            BATCH_SIGNAL_BY_FOLDER.pop(signal_key, None)
+        return return_code, batch_signal.usage_by_name
+
+
+class CoordinatorManager(BaseManager):
+    pass
+
+
+CoordinatorManager.register('get_task_queue')
+CoordinatorManager.register('get_result_queue')
+
+
+class CoordinatorQueue():
+
+    def __init__(self, tasks):
+        self._queue = Queue()
+        self._lease_time_by_task = {}
+        self._lock = Lock()
+        for task in tasks:
+            self._queue.put(task)
+
+    def get(self, timeout=None):
+        task = self._queue.get(timeout=timeout)
+        with self._lock:
+            self._lease_time_by_task[task] = time()
+        return task
+
+    def renew(self, task):
+        with self._lock:
+            if task in self._lease_time_by_task:
+                self._lease_time_by_task[task] = time()
+
+    def finish(self, task):
+        with self._lock:
+            self._lease_time_by_task.pop(task, None)
+
+    def requeue(self, lease_in_seconds):
+        # Give tasks whose worker stopped renewing them to another worker
+        expiration_time = time() - lease_in_seconds
+        with self._lock:
+            tasks = [
+                task for task, lease_time in self._lease_time_by_task.items()
+                if lease_time < expiration_time]
+            for task in tasks:
+                del self._lease_time_by_task[task]
+        for task in tasks:
+            self._queue.put(task)
+        return tasks
+
+
+class BatchSignal():
+
+    def __init__(self, timeout_timedelta=None, limit_by_name=None):
+        self.code = None
+        self.limit_by_name = limit_by_name or {}
+        self.usage_by_name = dict.fromkeys(USAGE_NAMES, 0)
+        self._kills = []
+        self._lock = Lock()
+        self._timer = None
+        if timeout_timedelta:
+            self._timer = timer = Timer(
+                timeout_timedelta.total_seconds(), self.stop, [
+                    Error.COMMAND_TIMED_OUT])
+            timer.daemon = True
+            timer.start()
+
+    def stop(self, code=Error.COMMAND_CANCELLED):
+        with self._lock:
+            if self.code is not None:
+                return
+            self.code = code
+            kills = self._kills.copy()
+        for kill in kills:
+            kill()
+
+    def check(self):
+        code = self.code
+        if code is None:
+            return
+        error = CrossComputeExecutionError(
+            'batch timed out' if code == Error.COMMAND_TIMED_OUT else
+            'batch cancelled')
+        error.code = code
+        raise error
+
+    def close(self):
+        if self._timer:
+            self._timer.cancel()
+
+    def record(self, usage_by_name):
+        with self._lock:
+            merge_usage_by_name(self.usage_by_name, usage_by_name)
+
+    @contextmanager
+    def watch(self, kill):
+        with self._lock:
+            self._kills.append(kill)
+            is_stopped = self.code is not None
+        if is_stopped:
+            kill()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._kills.remove(kill)
 
 
 class UnsafeEngine(AbstractEngine):
 
     def prepare(self, automation_definition):
-        # TODO: Consider having a separate venv for each automation
-        automation_folder = automation_definition.folder
-        d = automation_definition.package_ids_by_manager_name
-        try:
-            for manager_name, package_ids in d.items():
-                subprocess.run(
-                    [manager_name, 'install'] + list(package_ids),
-                    cwd=automation_folder,
-                    check=True)
-        except (OSError, subprocess.CalledProcessError) as e:
-            raise CrossComputeExecutionError(
-                'could not install packages: %s' % e)
+        prepare_package_folder(
+            automation_definition.package_ids_by_manager_name)
         for s in automation_definition.script_definitions:
             s.get_command_string()
 
-    def run(self, automation_definition, batch_folder, custom_environment):
+    def run(
+            self, automation_definition, batch_folder, custom_environment,
+            batch_signal):
         step_folder_by_name = _get_step_folder_by_name(
             automation_definition.folder, batch_folder)
         script_definitions = automation_definition.script_definitions
         script_environment = _prepare_script_environment(
             step_folder_by_name, custom_environment, with_path=True)
+        script_environment.update(get_package_environment(
+            automation_definition.package_ids_by_manager_name,
+            script_environment['PATH']))
         debug_folder = step_folder_by_name['debug_folder']
         o_path = debug_folder / 'stdout.txt'
         e_path = debug_folder / 'stderr.txt'
         with o_path.open('wt') as o_file, e_path.open('w+t') as e_file:
-            for script_definition in script_definitions:
-                return_code = _run_script(
-                    script_definition, step_folder_by_name,
-                    script_environment, o_file, e_file)
+            if _is_sequential(script_definitions):
+                for script_definition in script_definitions:
+                    return_code = self.run_script(
+                        script_definition, step_folder_by_name,
+                        script_environment, o_file, e_file, batch_signal)
+            else:
+                return_code = self.run_script_graph(
+                    script_definitions,
+                    automation_definition.script_worker_count,
+                    step_folder_by_name, script_environment, o_file, e_file,
+                    batch_signal)
+        return return_code
+
+    def run_script_graph(
+            self, script_definitions, worker_count, step_folder_by_name,
+            script_environment, o_file, e_file, batch_signal):
+        debug_folder = step_folder_by_name['debug_folder']
+        path_packs = [(
+            debug_folder / f'stdout-{_}.txt', debug_folder / f'stderr-{_}.txt',
+        ) for _ in _get_script_names(script_definitions)]
+
+        def run(index):
+            o_path, e_path = path_packs[index]
+            with o_path.open('wt') as o_file, e_path.open('w+t') as e_file:
+                return self.run_script(
+                    script_definitions[index], step_folder_by_name,
+                    script_environment, o_file, e_file, batch_signal)
+
+        remaining_indices = list(range(len(script_definitions)))
+        done_indices, index_by_future = set(), {}
+        return_code, error = 0, None
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            while True:
+                for index in [] if error else remaining_indices.copy():
+                    if not done_indices.issuperset(script_definitions[
+                            index].dependency_indices):
+                        continue
+                    remaining_indices.remove(index)
+                    index_by_future[executor.submit(run, index)] = index
+                if not index_by_future:
+                    break
+                futures = wait(index_by_future, return_when=FIRST_COMPLETED)[0]
+                for future in futures:
+                    index = index_by_future.pop(future)
+                    try:
+                        return_code = future.result()
+                    except CrossComputeError as e:
+                        error = error or e
+                    else:
+                        done_indices.add(index)
+        # Combine outputs in script order while keeping the separate files
+        for o_path, e_path in path_packs:
+            for path, file in [(o_path, o_file), (e_path, e_file)]:
+                if path.exists():
+                    file.write(path.read_text())
+        if error:
+            raise error
+        return return_code
+
+    def run_script(
+            self, script_definition, step_folder_by_name, script_environment,
+            o_file, e_file, batch_signal):
+        return _run_script(
+            script_definition, step_folder_by_name, script_environment,
+            o_file, e_file, batch_signal)
+
+
+class WarmEngine(UnsafeEngine):
+
+    def prepare(self, automation_definition):
+        super().prepare(automation_definition)
+        site_folder = _get_site_folder(get_package_environment(
+            automation_definition.package_ids_by_manager_name, ''))
+        for s in automation_definition.script_definitions:
+            if 'function' in s:
+                get_function_pool(s, _get_worker_count(), site_folder)
+
+    def run_script(
+            self, script_definition, step_folder_by_name, script_environment,
+            o_file, e_file, batch_signal):
+        if 'function' not in script_definition:
+            return super().run_script(
+                script_definition, step_folder_by_name, script_environment,
+                o_file, e_file, batch_signal)
+        batch_signal.check()
+        function_pool = get_function_pool(
+            script_definition, _get_worker_count(),
+            _get_site_folder(script_environment))
+        return_code = function_pool.run(
+            step_folder_by_name, script_environment, o_file.name, e_file.name,
+            batch_signal)
+        o_file.seek(0, 2)
+        batch_signal.check()
+        if return_code != 0:
+            e_file.seek(0)
+            error = CrossComputeExecutionError(e_file.read().rstrip())
+            error.code = return_code
+            raise error
+        e_file.seek(0, 2)
         return return_code
 
 
@@ -140,79 +486,343 @@ class PodmanEngine(AbstractEngine):
     def prepare(self, automation_definition):
         if not automation_definition.script_definitions:
             return
-        image_name = _get_image_name(automation_definition)
-        if not self.with_rebuild and _has_podman_image(image_name):
-            return
         automation_folder = automation_definition.folder
+        container_file_text = _prepare_container_file_text(
+            automation_definition)
+        container_script_text = _prepare_container_script_text(
+            automation_definition)
+        image_name = _get_image_name(
+            automation_definition, container_file_text, container_script_text)
+        with CONTAINER_POOL_LOCK:
+            old_image_name = IMAGE_NAME_BY_FOLDER.get(automation_folder)
+            IMAGE_NAME_BY_FOLDER[automation_folder] = image_name
+            container_pool = CONTAINER_POOL_BY_IMAGE_NAME.pop(
+                old_image_name, None) if old_image_name != image_name else None
+        if container_pool:
+            container_pool.stop()
+        if _has_podman_image(image_name):
+            L.info('using existing image "%s"', image_name)
+            return
         (automation_folder / CONTAINER_FILE_NAME).write_text(
-            _prepare_container_file_text(automation_definition))
+            container_file_text)
         (automation_folder / '.containerignore').write_text(
             CONTAINER_IGNORE_TEXT)
-        command_texts = [
-            s.get_command_string().format(**CONTAINER_STEP_FOLDER_BY_NAME)
-            for s in automation_definition.script_definitions]
         (automation_folder / CONTAINER_SCRIPT_NAME).write_text(
-            '\n'.join([_ + CONTAINER_PIPE_TEXT for _ in command_texts]))
-        if subprocess.run([
-            'podman', 'build', '-t', image_name, '-f', CONTAINER_FILE_NAME,
-        ], cwd=automation_folder).returncode != 0:
+            container_script_text)
+        if _run_podman_command({'cwd': automation_folder}, [
+            'build', '-t', image_name, '-f', CONTAINER_FILE_NAME,
+        ]).returncode != 0:
             raise CrossComputeExecutionError(f'could not build "{image_name}"')
 
-    def run(self, automation_definition, batch_folder, custom_environment):
-        automation_folder = automation_definition.folder
-        absolute_batch_folder = automation_folder / batch_folder
-        container_id, port_packs = _run_podman_image(
-            automation_definition, batch_folder, custom_environment)
+    def run(
+            self, automation_definition, batch_folder, custom_environment,
+            batch_signal):
+        absolute_batch_folder = automation_definition.folder / batch_folder
+        container_pool = get_container_pool(automation_definition)
+        container = container_pool.checkout()
+        is_reusable = not automation_definition.port_definitions
         try:
-            with _proxy_podman_ports(
+            with _bind_podman_batch(
+                    container, absolute_batch_folder,
+                    custom_environment) as env_path, _proxy_podman_ports(
                     automation_definition, batch_folder, custom_environment,
-                    port_packs):
-                _copy_datasets_into_podman(container_id, automation_definition)
-                _set_podman_folder_owner(
-                    absolute_batch_folder, _get_podman_user_id(container_id))
-                return_code = _run_podman_command({'cwd': automation_folder}, [
-                    'exec', '--env-file', CONTAINER_ENV_NAME, container_id,
-                    'bash', CONTAINER_SCRIPT_NAME]).returncode
+                    container.port_packs):
+                _copy_datasets_into_podman(
+                    container.id, automation_definition)
+                with _measure_podman_usage(
+                        container, batch_signal), batch_signal.watch(
+                        lambda: _run_podman_command({}, [
+                            'kill', container.id])):
+                    return_code = _run_podman_command({}, [
+                        'exec', '--env-file', str(env_path), container.id,
+                        'bash', CONTAINER_SCRIPT_NAME]).returncode
         except KeyboardInterrupt:
             return_code = Error.COMMAND_INTERRUPTED
-        except Exception:
-            raise
+            is_reusable = False
         finally:
-            _set_podman_folder_owner(absolute_batch_folder, 0)
-            _run_podman_command({}, ['kill', container_id])
+            if batch_signal.code:
+                is_reusable = False
+            container_pool.checkin(container, is_reusable)
+        batch_signal.check()
         return _process_podman_return_code(return_code, absolute_batch_folder)
 
 
+class PodmanContainer():
+
+    def __init__(
+            self, container_id, port_packs, host_folder, user_id,
+            cgroup_folder=None):
+        self.id = container_id
+        self.port_packs = port_packs
+        self.host_folder = host_folder
+        self.user_id = user_id
+        self.cgroup_folder = cgroup_folder
+        self.idle_time = time()
+        self.dataset_key = None
+        self.usage_by_name = None
+
+
+class ContainerPool():
+
+    def __init__(self, automation_definition):
+        self.automation_definition = automation_definition
+        self.size = automation_definition.container_pool_size
+        self.idle_timedelta = automation_definition.container_idle_timedelta
+        self._idle_containers = []
+        self._container_count = 0
+        self._condition = Condition()
+        self._is_stopped = False
+        self._dataset_key = None
+        Thread(target=self._reap_loop, daemon=True).start()
+        # Kill containers before multiprocessing joins child processes on exit
+        Finalize(self, self.stop, exitpriority=10)
+
+    def checkout(self):
+        dataset_key = _get_podman_dataset_key(self.automation_definition)
+        with self._condition:
+            if dataset_key != self._dataset_key:
+                # Bind mounts keep the old inode after a dataset is replaced
+                stale_containers = self._idle_containers
+                self._idle_containers = []
+                self._container_count -= len(stale_containers)
+                self._dataset_key = dataset_key
+                self._condition.notify_all()
+            else:
+                stale_containers = []
+        for container in stale_containers:
+            L.debug('stopping container %s with old datasets', container.id)
+            _stop_podman_container(container)
+        with self._condition:
+            while not self._idle_containers and (
+                    self._container_count >= self.size):
+                self._condition.wait()
+            if self._idle_containers:
+                return self._idle_containers.pop()
+            self._container_count += 1
+        try:
+            container = _start_podman_container(self.automation_definition)
+        except CrossComputeError:
+            with self._condition:
+                self._container_count -= 1
+                self._condition.notify()
+            raise
+        container.dataset_key = dataset_key
+        return container
+
+    def checkin(self, container, is_reusable=True):
+        with self._condition:
+            is_reusable = is_reusable and not self._is_stopped and (
+                container.dataset_key == self._dataset_key)
+            if is_reusable:
+                container.idle_time = time()
+                self._idle_containers.append(container)
+            else:
+                self._container_count -= 1
+            self._condition.notify()
+        if not is_reusable:
+            _stop_podman_container(container)
+
+    def stop(self):
+        with self._condition:
+            self._is_stopped = True
+            containers = self._idle_containers
+            self._idle_containers = []
+            self._container_count -= len(containers)
+        for container in containers:
+            _stop_podman_container(container)
+
+    def _reap_loop(self):
+        idle_seconds = self.idle_timedelta.total_seconds()
+        while not self._is_stopped:
+            sleep(min(idle_seconds, CONTAINER_REAP_INTERVAL_IN_SECONDS))
+            expiration_time = time() - idle_seconds
+            with self._condition:
+                containers = [
+                    _ for _ in self._idle_containers
+                    if _.idle_time < expiration_time]
+                for container in containers:
+                    self._idle_containers.remove(container)
+                self._container_count -= len(containers)
+            for container in containers:
+                L.debug('stopping idle container %s', container.id)
+                _stop_podman_container(container)
+
+
 def run_automation(automation_definition, user_environment, with_rebuild=True):
-    run_batch = get_script_engine(
-        automation_definition.engine_name, with_rebuild).run_batch
+    engine = get_script_engine(
+        automation_definition.engine_name, with_rebuild)
     concurrency_name = automation_definition.batch_concurrency_name
     update_datasets(automation_definition)
     try:
         if concurrency_name == 'single':
             _run_automation_single(
-                automation_definition, run_batch, user_environment)
+                automation_definition, engine.run_batch, user_environment)
+        elif concurrency_name == 'vector':
+            _run_automation_vector(
+                automation_definition, engine.run_vector, user_environment)
         else:
             _run_automation_multiple(
-                automation_definition, run_batch, user_environment,
+                automation_definition, engine.run_batch, user_environment,
                 concurrency_name)
     except CrossComputeError as e:
         e.automation_definition = automation_definition
         L.error(e)
 
 
-def run_batch(automation_definition, batch_definition, user_environment):
+def run_batch(
+        automation_definition, batch_definition, user_environment,
+        attempt_count=1):
     engine = get_script_engine(
         automation_definition.engine_name, with_rebuild=False)
     update_datasets(automation_definition)
     return engine.run_batch(
-        automation_definition, batch_definition, user_environment)
+        automation_definition, batch_definition, user_environment,
+        attempt_count)
+
+
+def run_coordinator(automation_definitions, address_text):
+    tasks, result_queue = [], Queue()
+    automation_definition_by_slug = {}
+    for automation_definition in automation_definitions:
+        automation_definition_by_slug[
+            automation_definition.slug] = automation_definition
+        for batch_index, batch_definition in enumerate(
+                automation_definition.batch_definitions):
+            prepare_batch(automation_definition, batch_definition)
+            tasks.append((
+                automation_definition.slug, batch_index,
+                str(batch_definition.folder)))
+    task_queue = CoordinatorQueue(tasks)
+    task_count = len(tasks)
+
+    class Manager(CoordinatorManager):
+        pass
+
+    Manager.register('get_task_queue', callable=lambda: task_queue)
+    Manager.register('get_result_queue', callable=lambda: result_queue)
+    try:
+        server = Manager(
+            get_coordinator_address(address_text),
+            get_coordinator_key()).get_server()
+    except OSError as e:
+        raise CrossComputeExecutionError(
+            f'could not coordinate at {address_text}; {e}')
+    Thread(target=server.serve_forever, daemon=True).start()
+    L.info('coordinating %s batches at %s', task_count, address_text)
+    task_by_key = {_[:2]: _ for _ in tasks}
+    while task_by_key:
+        for task in task_queue.requeue(COORDINATOR_LEASE_IN_SECONDS):
+            L.warning('requeueing batch %s of %s', task[2], task[0])
+        try:
+            automation_slug, batch_index, archive_bytes = result_queue.get(
+                timeout=COORDINATOR_POLL_IN_SECONDS)
+        except Empty:
+            continue
+        task = task_by_key.pop((automation_slug, batch_index), None)
+        if not task:
+            # Ignore the late result of a task that was requeued
+            continue
+        task_queue.finish(task)
+        automation_definition = automation_definition_by_slug[automation_slug]
+        batch_definition = automation_definition.batch_definitions[
+            batch_index]
+        batch_identifier = ' '.join([
+            automation_definition.name, automation_definition.version,
+            str(batch_definition.folder)])
+        if not archive_bytes:
+            L.error('%s failed on worker', batch_identifier)
+            continue
+        _unpack_batch(
+            automation_definition.folder / batch_definition.folder,
+            archive_bytes)
+        L.info('%s synced', batch_identifier)
+
+
+def run_worker(
+        automation_definitions, address_text, user_environment,
+        with_rebuild=True):
+    manager = CoordinatorManager(
+        get_coordinator_address(address_text), get_coordinator_key())
+    try:
+        manager.connect()
+    except OSError as e:
+        raise CrossComputeExecutionError(
+            f'could not connect to coordinator at {address_text}; {e}')
+    task_queue = manager.get_task_queue()
+    result_queue = manager.get_result_queue()
+    run_batch_by_slug, batch_definition_by_key = {}, {}
+    for automation_definition in automation_definitions:
+        automation_slug = automation_definition.slug
+        prepare_automation(automation_definition, with_rebuild)
+        update_datasets(automation_definition)
+        run_batch_by_slug[automation_slug] = partial(
+            get_script_engine(
+                automation_definition.engine_name, with_rebuild=False,
+            ).run_batch, automation_definition)
+        # Match batches by folder because the coordinator might select fewer
+        for batch_definition in automation_definition.batch_definitions:
+            batch_definition_by_key[
+                automation_slug, str(batch_definition.folder)
+            ] = batch_definition
+    L.info('working for coordinator at %s', address_text)
+    with ThreadPoolExecutor(max_workers=_get_worker_count()) as executor:
+        futures = [executor.submit(
+            _work_for_coordinator, task_queue, result_queue,
+            run_batch_by_slug, batch_definition_by_key, user_environment,
+        ) for _ in range(_get_worker_count())]
+        for future in as_completed(futures):
+            future.result()
+
+
+def get_coordinator_address(address_text):
+    if '/' in address_text:
+        # Use a unix socket when the address looks like a path
+        return address_text
+    host, _, port = address_text.rpartition(':')
+    try:
+        return host or HOST, int(port)
+    except ValueError:
+        raise CrossComputeConfigurationError(
+            f'coordinator address "{address_text}" is not parsable; '
+            f'something like "{HOST}:{COORDINATOR_PORT}" was expected')
+
+
+def get_coordinator_key():
+    coordinator_key = getenv('CROSSCOMPUTE_COORDINATOR_KEY')
+    if not coordinator_key:
+        raise CrossComputeConfigurationError(
+            'CROSSCOMPUTE_COORDINATOR_KEY must be set on the coordinator and '
+            'its workers')
+    return coordinator_key.encode()
+
+
+def is_batch_changed(automation_definition, batch_definition):
+    batch_folder, batch_environment = prepare_batch(
+        automation_definition, batch_definition)
+    debug_path = automation_definition.folder / batch_folder / 'debug' / (
+        'variables.dictionary')
+    try:
+        debug_dictionary = load_file_json(debug_path)
+    except (OSError, json.JSONDecodeError):
+        return True
+    if debug_dictionary.get('return_code') != 0:
+        return True
+    return debug_dictionary.get('batch_digest') != get_batch_digest(
+        automation_definition, batch_folder, batch_environment,
+        automation_definition.dataset_digest_by_path)
+
+
+def get_shard_index(batch_slug, shard_count):
+    # Hash the slug so that shards stay stable when batches are added
+    digest = sha256(batch_slug.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
 
 
 def get_script_engine(engine_name, with_rebuild=True):
     try:
         ScriptEngine = {
             'unsafe': UnsafeEngine,
+            'warm': WarmEngine,
             'podman': PodmanEngine,
         }[engine_name]
     except KeyError:
@@ -223,6 +833,7 @@ def get_script_engine(engine_name, with_rebuild=True):
 
 def update_datasets(automation_definition):
     automation_folder = automation_definition.folder
+    uri_packs = []
     for dataset_definition in automation_definition.dataset_definitions:
         target_path = automation_folder / dataset_definition.path
         target_folder = make_folder(target_path.parent)
@@ -238,43 +849,381 @@ def update_datasets(automation_definition):
                 continue
             symlink(relpath(source_path, target_folder), target_path)
         elif 'uri' in reference_configuration:
-            reference_uri = reference_configuration['uri']
-            try:
-                download_uri(reference_uri, target_path)
-            except URLError:
-                L.error(f'could not download dataset from {reference_uri}')
+            uri_packs.append((
+                reference_configuration['uri'], target_path,
+                dataset_definition.max_age_in_seconds,
+                dataset_definition.sha256_digest))
+    download_datasets(uri_packs)
+    if automation_definition.with_digest:
+        # Hash datasets once per run instead of once per batch
+        automation_definition.dataset_digest_by_path = (
+            get_dataset_digest_by_path(automation_definition))
 
 
 def process_loop(
         automation_definitions, automation_tasks, live_uris, file_changes,
-        user_environment, server_uri, with_rebuild):
+        wakeup, queues, user_environment, server_uri, with_rebuild):
     thread = Thread(
         target=prepare_loop, args=(automation_definitions, with_rebuild),
         daemon=True)
     thread.start()
+    task_scheduler = TaskScheduler(
+        automation_definitions, user_environment, server_uri, wakeup, queues)
     try:
         while True:
-            sleep(1)
+            wakeup.wait(task_scheduler.get_timeout())
+            # Clear before collecting so that no signal is lost
+            wakeup.clear()
+            task_scheduler.collect(automation_tasks, live_uris, file_changes)
+            task_scheduler.dispatch()
+    except KeyboardInterrupt:
+        pass
+
+
+class TaskScheduler():
+
+    def __init__(
+            self, automation_definitions, user_environment, server_uri,
+            wakeup, queues):
+        self.automation_definitions = automation_definitions
+        self.user_environment = user_environment
+        self.server_uri = server_uri
+        self.worker_count = _get_worker_count()
+        self._wakeup = wakeup
+        self._queues = queues
+        # Tasks for the same batch are merged while they wait
+        self._pending_task_by_key = {}
+        self._follow_up_task_by_key = {}
+        self._running_keys = set()
+        self._due_packs = []
+        self._due_time_by_key = {}
+        self._retry_packs = []
+        self._retry_time_by_key = {}
+        self._attempt_count_by_key = {}
+        self._finished_packs = SimpleQueue()
+        self._due_count = 0
+        self._running_count = 0
+        self._running_count_by_slug = defaultdict(int)
+        self._run_seconds_by_slug = {}
+        self._wait_seconds_by_slug = {}
+        self._queue_by_slug = {}
+        self._collected_count_by_slug = defaultdict(int)
+        # Share workers across automations with weighted fair queuing
+        self._interactive_keys = set()
+        self._interactive_keys_by_slug = defaultdict(dict)
+        self._background_keys_by_slug = defaultdict(dict)
+        self._added_time_by_key = {}
+        self._charge_by_key = {}
+        self._virtual_time_by_slug = defaultdict(float)
+        self._virtual_time = 0
+        for automation_definition in automation_definitions:
+            if not automation_definition.is_interval_strict:
+                continue
+            for batch_definition in automation_definition.batch_definitions:
+                self._schedule(automation_definition, batch_definition)
+
+    def get_timeout(self):
+        due_times = [_ for _ in [
+            _get_next_time(self._due_packs, self._due_time_by_key),
+            _get_next_time(self._retry_packs, self._retry_time_by_key),
+        ] if _ is not None]
+        if due_times:
+            return max(0, min(due_times) - time())
+
+    def collect(self, automation_tasks, live_uris, file_changes):
+        while not self._finished_packs.empty():
+            self._finish(*self._finished_packs.get())
+        while True:
             try:
-                automation_task = _get_automation_task(
-                    automation_tasks, automation_definitions, live_uris,
-                    file_changes, user_environment)
+                automation_task = automation_tasks.pop(0)
             except IndexError:
+                break
+            if automation_task[3] != Task.CANCEL:
+                self._collected_count_by_slug[automation_task[0].slug] += 1
+            self.add(automation_task, is_interactive=True)
+        self._collect_due_tasks()
+        self._collect_retry_tasks()
+        self._collect_live_tasks(live_uris, file_changes)
+
+    def add(self, automation_task, is_interactive=False):
+        key = _get_batch_key(*automation_task[:2])
+        if automation_task[3] == Task.CANCEL:
+            self._cancel(key, *automation_task[:2])
+            return
+        if is_interactive:
+            self._interactive_keys.add(key)
+        # A new run replaces a scheduled retry
+        self._retry_time_by_key.pop(key, None)
+        if key in self._running_keys:
+            # Collapse tasks that arrive during a run into one follow-up
+            task_by_key = self._follow_up_task_by_key
+        else:
+            task_by_key = self._pending_task_by_key
+        old_task = task_by_key.get(key)
+        if old_task and Task.RUN_PRINT in (old_task[3], automation_task[3]):
+            automation_task = automation_task[:3] + (Task.RUN_PRINT,)
+        task_by_key[key] = automation_task
+        if task_by_key is self._pending_task_by_key:
+            self._enqueue(key)
+
+    def dispatch(self):
+        while self._running_count < self.worker_count:
+            key = self._choose_key()
+            if key is None:
+                break
+            self._start(key)
+        self._update_queues()
+
+    def _enqueue(self, key):
+        automation_slug = key[0]
+        if not self._has_work(automation_slug):
+            # Start an idle automation at the current virtual time so that
+            # it cannot claim the share that it did not use while idle
+            self._virtual_time_by_slug[automation_slug] = max(
+                self._virtual_time_by_slug[automation_slug],
+                self._virtual_time)
+        self._added_time_by_key.setdefault(key, time())
+        if key in self._interactive_keys:
+            self._background_keys_by_slug[automation_slug].pop(key, None)
+            self._interactive_keys_by_slug[automation_slug][key] = None
+        elif key not in self._interactive_keys_by_slug[automation_slug]:
+            self._background_keys_by_slug[automation_slug][key] = None
+
+    def _has_work(self, automation_slug):
+        return any([
+            self._running_count_by_slug[automation_slug],
+            self._interactive_keys_by_slug.get(automation_slug),
+            self._background_keys_by_slug.get(automation_slug)])
+
+    def _choose_key(self):
+        chosen_rank, chosen_key = None, None
+        automation_slugs = set(self._interactive_keys_by_slug) | set(
+            self._background_keys_by_slug)
+        for automation_slug in automation_slugs:
+            # Prefer interactive runs over interval and file change runs
+            for priority, keys_by_slug in enumerate([
+                    self._interactive_keys_by_slug,
+                    self._background_keys_by_slug]):
+                key = self._peek_key(keys_by_slug, automation_slug)
+                if key:
+                    break
+            else:
                 continue
-            thread = Thread(
-                target=_process_task, args=automation_task + (server_uri,),
-                daemon=True)
-            thread.start()
-    except KeyboardInterrupt:
-        pass
+            automation_definition = self._pending_task_by_key[key][0]
+            if self._running_count_by_slug[
+                    automation_slug] >= automation_definition.queue_size:
+                continue
+            rank = priority, self._virtual_time_by_slug[automation_slug]
+            if chosen_rank is None or rank < chosen_rank:
+                chosen_rank, chosen_key = rank, key
+        return chosen_key
+
+    def _peek_key(self, keys_by_slug, automation_slug):
+        keys = keys_by_slug.get(automation_slug)
+        while keys:
+            key = next(iter(keys))
+            if key in self._pending_task_by_key:
+                return key
+            # Drop keys that were cancelled
+            del keys[key]
+        keys_by_slug.pop(automation_slug, None)
+
+    def _start(self, key):
+        automation_task = self._pending_task_by_key.pop(key)
+        automation_definition = automation_task[0]
+        automation_slug = automation_definition.slug
+        self._interactive_keys.discard(key)
+        self._interactive_keys_by_slug[automation_slug].pop(key, None)
+        self._background_keys_by_slug[automation_slug].pop(key, None)
+        now = time()
+        wait_seconds = now - self._added_time_by_key.pop(key, now)
+        old_seconds = self._wait_seconds_by_slug.get(
+            automation_slug, wait_seconds)
+        self._wait_seconds_by_slug[automation_slug] = (
+            old_seconds + wait_seconds) / 2
+        # Charge the expected run time now and correct it when it finishes
+        run_seconds = self._run_seconds_by_slug.get(automation_slug, 1)
+        self._charge_by_key[key] = run_seconds
+        virtual_time = self._virtual_time_by_slug[automation_slug]
+        self._virtual_time = virtual_time
+        self._virtual_time_by_slug[automation_slug] = virtual_time + (
+            run_seconds / automation_definition.queue_weight)
+        self._running_keys.add(key)
+        self._running_count += 1
+        self._running_count_by_slug[automation_slug] += 1
+        thread = Thread(target=self._process_task, args=(
+            automation_task, self._attempt_count_by_key.get(key, 1)),
+            daemon=True)
+        thread.start()
+
+    def _process_task(self, automation_task, attempt_count):
+        start_time, return_code = time(), None
+        try:
+            return_code = _process_task(
+                *automation_task, self.server_uri, attempt_count)
+        finally:
+            self._finished_packs.put((
+                automation_task, time() - start_time, return_code))
+            self._wakeup.set()
+
+    def _cancel(self, key, automation_definition, batch_definition):
+        self._pending_task_by_key.pop(key, None)
+        self._follow_up_task_by_key.pop(key, None)
+        self._added_time_by_key.pop(key, None)
+        self._interactive_keys.discard(key)
+        self._retry_time_by_key.pop(key, None)
+        if key in self._running_keys:
+            batch_signal = BATCH_SIGNAL_BY_FOLDER.get(
+                automation_definition.folder / batch_definition.folder)
+            if batch_signal:
+                batch_signal.stop()
+
+    def _finish(self, automation_task, run_seconds, return_code=0):
+        automation_definition, batch_definition = automation_task[:2]
+        automation_slug = automation_definition.slug
+        key = _get_batch_key(automation_definition, batch_definition)
+        attempt_count = self._attempt_count_by_key.pop(key, 1)
+        self._running_keys.discard(key)
+        self._running_count -= 1
+        self._running_count_by_slug[automation_slug] -= 1
+        old_seconds = self._run_seconds_by_slug.get(
+            automation_slug, run_seconds)
+        self._run_seconds_by_slug[automation_slug] = (
+            old_seconds + run_seconds) / 2
+        charged_seconds = self._charge_by_key.pop(key, run_seconds)
+        self._virtual_time_by_slug[automation_slug] += (
+            run_seconds - charged_seconds) / automation_definition.queue_weight
+        follow_up_task = self._follow_up_task_by_key.pop(key, None)
+        if follow_up_task:
+            self.add(follow_up_task)
+        elif _is_retryable(automation_definition, return_code, attempt_count):
+            self._retry(key, automation_task, attempt_count)
+        if automation_definition.is_interval_strict:
+            self._schedule(automation_definition, batch_definition)
+
+    def _retry(self, key, automation_task, attempt_count):
+        # Wait in the scheduler instead of blocking a worker thread
+        retry_in_seconds = automation_task[
+            0].retry_backoff_timedelta.total_seconds() * 2 ** (
+                attempt_count - 1)
+        due_time = time() + retry_in_seconds
+        self._retry_time_by_key[key] = due_time
+        self._due_count += 1
+        heappush(self._retry_packs, (
+            due_time, self._due_count, key, automation_task,
+            attempt_count + 1))
+        L.info(
+            '%s %s retrying %s in %s seconds', automation_task[0].name,
+            automation_task[0].version, automation_task[1].folder,
+            retry_in_seconds)
+
+    def _update_queues(self):
+        pending_count_by_slug = defaultdict(int)
+        for task_by_key in [
+                self._pending_task_by_key, self._follow_up_task_by_key]:
+            for automation_slug, batch_slug in task_by_key:
+                pending_count_by_slug[automation_slug] += 1
+        for automation_definition in self.automation_definitions:
+            automation_slug = automation_definition.slug
+            pending_count = pending_count_by_slug[automation_slug]
+            run_seconds = self._run_seconds_by_slug.get(automation_slug, 0)
+            d = {
+                'pending_count': pending_count,
+                'running_count': self._running_count_by_slug[automation_slug],
+                'retry_in_seconds': ceil(pending_count * run_seconds / min(
+                    automation_definition.queue_size, self.worker_count)),
+                'wait_in_seconds': round(self._wait_seconds_by_slug.get(
+                    automation_slug, 0), 3),
+                'collected_count': self._collected_count_by_slug[
+                    automation_slug]}
+            if self._queue_by_slug.get(automation_slug) != d:
+                self._queue_by_slug[automation_slug] = d
+                self._queues[automation_slug] = d
+
+    def _collect_due_tasks(self):
+        due_packs = self._due_packs
+        now = time()
+        while due_packs and due_packs[0][0] <= now:
+            due_time, _, key, automation_definition, batch_definition = \
+                heappop(due_packs)
+            if self._due_time_by_key.get(key) != due_time:
+                continue
+            del self._due_time_by_key[key]
+            if not automation_definition.is_interval_strict:
+                # Live batches are checked in _collect_live_tasks
+                continue
+            if key in self._running_keys:
+                continue
+            if automation_definition.is_interval_ready(batch_definition):
+                self.add((
+                    automation_definition, batch_definition,
+                    self.user_environment, Task.RUN_PRINT))
+            else:
+                self._schedule(automation_definition, batch_definition)
+
+    def _collect_retry_tasks(self):
+        retry_packs = self._retry_packs
+        now = time()
+        while retry_packs and retry_packs[0][0] <= now:
+            due_time, _, key, automation_task, attempt_count = heappop(
+                retry_packs)
+            if self._retry_time_by_key.get(key) != due_time:
+                continue
+            self.add(automation_task)
+            self._attempt_count_by_key[key] = attempt_count
+
+    def _collect_live_tasks(self, live_uris, file_changes):
+        automation_definitions = self.automation_definitions
+        for live_uri in set(live_uris):
+            try:
+                automation_definition, batch_definition = \
+                    _get_automation_pack(automation_definitions, live_uri)
+            except IndexError:
+                continue
+            key = _get_batch_key(automation_definition, batch_definition)
+            if key in self._running_keys:
+                # Changes during the run are checked again when it finishes
+                continue
+            task_mode = _get_task_mode(
+                automation_definition, batch_definition, file_changes)
+            if task_mode is not None:
+                self.add((
+                    automation_definition, batch_definition,
+                    self.user_environment, task_mode))
+            elif automation_definition.interval_timedelta:
+                self._schedule(automation_definition, batch_definition)
+
+    def _schedule(self, automation_definition, batch_definition):
+        key = _get_batch_key(automation_definition, batch_definition)
+        batch_clock = batch_definition.clock
+        run_time = batch_clock.get_end_time(
+            'run') or batch_clock.get_start_time('run')
+        due_time = run_time + automation_definition.interval_timedelta \
+            .total_seconds()
+        if self._due_time_by_key.get(key) == due_time:
+            return
+        self._due_time_by_key[key] = due_time
+        self._due_count += 1
+        heappush(self._due_packs, (
+            due_time, self._due_count, key, automation_definition,
+            batch_definition))
 
 
 def prepare_loop(automation_definitions, with_rebuild):
     for a in automation_definitions:
         for b in a.batch_definitions:
             prepare_batch(a, b)
-    for a in automation_definitions:
-        prepare_automation(a, with_rebuild)
+    if len(automation_definitions) < 2:
+        for a in automation_definitions:
+            prepare_automation(a, with_rebuild)
+        return
+    # Build missing images at the same time
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(
+            prepare_automation, a, with_rebuild,
+        ) for a in automation_definitions]
+        for future in as_completed(futures):
+            future.result()
 
 
 def prepare_automation(automation_definition, with_rebuild=True):
@@ -299,7 +1248,7 @@ def prepare_batch(automation_definition, batch_definition):
     input_folder = step_folder_by_name['input_folder']
     for path, variable_definitions in variable_definitions_by_path.items():
         input_path = input_folder / path
-        save_variable_data(input_path, batch_definition, variable_definitions)
+        save_variable_data(input_path, data_by_id, variable_definitions)
     return batch_folder, batch_environment
 
 
@@ -313,59 +1262,269 @@ def _run_automation_multiple(
     worker_count = getenv('CROSSCOMPUTE_WORKER_COUNT')
     if worker_count:
         worker_count = int(worker_count)
+    batch_definitions = automation_definition.batch_definitions
     if concurrency_name == 'thread':
-        BatchExecutor = ThreadPoolExecutor
+        executor = ThreadPoolExecutor(max_workers=worker_count)
+        submit = partial(
+            executor.submit, _run_batch_debug, automation_definition,
+            run_batch, user_environment)
     else:
-        BatchExecutor = ProcessPoolExecutor
-    with BatchExecutor(max_workers=worker_count) as executor:
-        futures = []
-        for batch_definition in automation_definition.batch_definitions:
-            futures.append(executor.submit(
-                run_batch, automation_definition, batch_definition,
-                user_environment))
+        # Fork workers with the automation so that tasks only send an index
+        executor = ProcessPoolExecutor(
+            max_workers=worker_count, mp_context=multiprocessing_context,
+            initializer=_initialize_batch_worker, initargs=(
+                automation_definition, run_batch, user_environment))
+        submit = partial(executor.submit, _run_batch_by_index)
+    with executor:
+        futures = [submit(_) for _ in range(len(batch_definitions))]
         try:
             for future in as_completed(futures):
                 d = future.result()
-                L.info('execution_time_in_seconds = %s' % d['debug'][
+                L.info('execution_time_in_seconds = %s' % d[
                     'execution_time_in_seconds'])
         except KeyboardInterrupt:
             pass
 
 
-def _get_automation_task(
-        automation_tasks, automation_definitions, live_uris, file_changes,
-        user_environment):
-    if automation_tasks:
-        return automation_tasks.pop(0)
-    automation_definition = None
-    if live_uris:
+def _run_automation_vector(
+        automation_definition, run_vector, user_environment):
+    batch_definitions = automation_definition.batch_definitions
+    chunk_size = automation_definition.batch_chunk_size
+    with ThreadPoolExecutor(max_workers=_get_worker_count()) as executor:
+        futures = [executor.submit(
+            run_vector, automation_definition,
+            batch_definitions[_:_ + chunk_size], user_environment,
+        ) for _ in range(0, len(batch_definitions), chunk_size)]
         try:
-            automation_definition, batch_definition = _get_automation_pack(
-                automation_definitions, choice(live_uris))
-        except IndexError:
+            for future in as_completed(futures):
+                for d in future.result():
+                    L.info('execution_time_in_seconds = %s' % d['debug'][
+                        'execution_time_in_seconds'])
+        except KeyboardInterrupt:
             pass
-        if automation_definition:
-            task_mode = _get_task_mode(
-                automation_definition, batch_definition, file_changes)
-            if task_mode is None:
-                automation_definition = None
-    if not automation_definition:
-        selected_automation_definitions = [
-            _ for _ in automation_definitions if _.is_interval_strict]
-        if selected_automation_definitions:
-            automation_definition = choice(selected_automation_definitions)
-            batch_definition = choice(automation_definition.batch_definitions)
-            if automation_definition.is_interval_ready(batch_definition):
-                task_mode = Task.RUN_PRINT
-            else:
-                automation_definition = None
-    if automation_definition:
-        batch_clock = batch_definition.clock
-        if batch_clock.is_in('run') or batch_clock.is_in('print'):
-            automation_definition = None
-    if not automation_definition:
-        raise IndexError
-    return automation_definition, batch_definition, user_environment, task_mode
+
+
+def _get_vector_input_row(
+        automation_definition, batch_definition, batch_environment,
+        variable_definitions):
+    input_folder = automation_definition.folder / batch_definition.folder / (
+        'input')
+    # Read the input folder to include batches that have no configuration
+    variable_data_by_id = get_data_by_id_from_folder(
+        input_folder, variable_definitions)
+    row = []
+    for variable_definition in variable_definitions:
+        variable_id = variable_definition.id
+        variable_data = variable_data_by_id.get(variable_id, {})
+        if variable_id in batch_environment:
+            value = batch_environment[variable_id]
+        elif 'value' in variable_data:
+            value = variable_data['value']
+            if isinstance(value, dict) or isinstance(value, list):
+                value = json.dumps(value)
+        elif variable_data:
+            # Point to the file that prepare_batch saved for this batch
+            value = str(input_folder / variable_definition.path)
+        else:
+            value = ''
+        row.append(value)
+    return row
+
+
+def _split_vector_outputs(
+        automation_definition, batch_definitions, batch_digests, vector_folder,
+        return_code, debug_data_by_id):
+    automation_folder = automation_definition.folder
+    variable_definitions = automation_definition.get_variable_definitions(
+        'output')
+    variable_definitions_by_path = group_by(variable_definitions, 'path')
+    vector_output_folder = vector_folder / 'output'
+    output_path = vector_output_folder / VECTOR_TABLE_NAME
+    data_by_ids = []
+    if return_code == 0:
+        try:
+            data_by_ids = list(yield_data_by_id_from_csv(
+                output_path, variable_definitions))
+        except CrossComputeError as e:
+            e.automation_definition = automation_definition
+            L.error(e)
+        if len(data_by_ids) != len(batch_definitions):
+            L.error(
+                '%s has %s rows instead of %s', format_path(output_path),
+                len(data_by_ids), len(batch_definitions))
+    variable_data_by_id_by_step_names = []
+    for batch_index, batch_definition in enumerate(batch_definitions):
+        batch_folder = automation_folder / batch_definition.folder
+        output_folder = batch_folder / 'output'
+        if batch_index < len(data_by_ids):
+            data_by_id = data_by_ids[batch_index]
+            for path, variable_definitions in (
+                    variable_definitions_by_path.items()):
+                variable_definitions = [
+                    _ for _ in variable_definitions if 'value' in
+                    data_by_id.get(_.id, {})]
+                if variable_definitions:
+                    save_variable_data(
+                        output_folder / path, data_by_id,
+                        variable_definitions)
+        # Copy files that the script saved for this row
+        row_folder = vector_output_folder / str(batch_index)
+        if row_folder.is_dir():
+            copytree(row_folder, output_folder, dirs_exist_ok=True)
+        if return_code != 0:
+            for name in 'stdout.txt', 'stderr.txt':
+                path = vector_folder / 'debug' / name
+                if path.exists():
+                    copy(path, batch_folder / 'debug' / name)
+        batch_debug_data_by_id = debug_data_by_id | {
+            'output_size_in_bytes': get_folder_size(output_folder),
+            'return_code': return_code}
+        if batch_digests:
+            batch_debug_data_by_id['batch_digest'] = batch_digests[
+                batch_index]
+        variable_data_by_id_by_step_names.append(_process_batch(
+            automation_definition, batch_definition, [
+                'output', 'log', 'debug',
+            ], {'debug': batch_debug_data_by_id}))
+    return variable_data_by_id_by_step_names
+
+
+def _work_for_coordinator(
+        task_queue, result_queue, run_batch_by_slug, batch_definition_by_key,
+        user_environment):
+    while True:
+        try:
+            # Keep asking because the coordinator requeues lost tasks
+            task = task_queue.get(timeout=COORDINATOR_POLL_IN_SECONDS)
+        except Empty:
+            continue
+        except (EOFError, OSError):
+            L.info('coordinator stopped')
+            break
+        automation_slug, batch_index, batch_folder_text = task
+        archive_bytes = b''
+        try:
+            with _renew_coordinator_task(task_queue, task):
+                run_batch = run_batch_by_slug[automation_slug]
+                automation_definition = run_batch.args[0]
+                batch_definition = batch_definition_by_key[
+                    automation_slug, batch_folder_text]
+                run_batch(batch_definition, user_environment)
+                archive_bytes = _pack_batch(
+                    automation_definition.folder / batch_definition.folder)
+        except KeyError:
+            L.error(
+                'batch %s of automation %s does not match the coordinator',
+                batch_folder_text, automation_slug)
+        except CrossComputeError as e:
+            L.error(e)
+        except Exception as e:
+            # Report every failure so that the coordinator does not wait
+            L.exception(e)
+        try:
+            result_queue.put((automation_slug, batch_index, archive_bytes))
+        except (EOFError, OSError):
+            L.info('coordinator stopped')
+            break
+
+
+@contextmanager
+def _renew_coordinator_task(task_queue, task):
+    is_done = Event()
+
+    def renew():
+        while not is_done.wait(COORDINATOR_LEASE_IN_SECONDS / 3):
+            try:
+                task_queue.renew(task)
+            except (EOFError, OSError):
+                break
+
+    thread = Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        is_done.set()
+        thread.join()
+
+
+def _pack_batch(absolute_batch_folder):
+    archive_buffer = BytesIO()
+    with tarfile.open(fileobj=archive_buffer, mode='w:gz') as archive:
+        for step_name in 'output', 'log', 'debug':
+            step_folder = absolute_batch_folder / step_name
+            if step_folder.exists():
+                archive.add(step_folder, step_name)
+    return archive_buffer.getvalue()
+
+
+def _unpack_batch(absolute_batch_folder, archive_bytes):
+    with tarfile.open(fileobj=BytesIO(archive_bytes)) as archive:
+        if hasattr(tarfile, 'data_filter'):
+            archive.extractall(absolute_batch_folder, filter='data')
+        else:
+            # Check members ourselves where python has no extraction filters
+            archive.extractall(absolute_batch_folder, members=list(
+                _yield_safe_members(archive, absolute_batch_folder)))
+
+
+def _yield_safe_members(archive, folder):
+    folder = Path(folder).resolve()
+    for member in archive.getmembers():
+        path = (folder / member.name).resolve()
+        if member.issym():
+            link_path = (path.parent / member.linkname).resolve()
+        elif member.islnk():
+            link_path = (folder / member.linkname).resolve()
+        elif member.isfile() or member.isdir():
+            link_path = path
+        else:
+            link_path = None
+        if link_path is None or not path.is_relative_to(
+                folder) or not link_path.is_relative_to(folder):
+            L.warning('skipping unsafe archive member %s', member.name)
+            continue
+        yield member
+
+
+def _initialize_batch_worker(
+        automation_definition, run_batch, user_environment):
+    BATCH_WORKER_PACK[:] = automation_definition, run_batch, user_environment
+
+
+def _run_batch_by_index(batch_index):
+    return _run_batch_debug(*BATCH_WORKER_PACK, batch_index)
+
+
+def _run_batch_debug(
+        automation_definition, run_batch, user_environment, batch_index):
+    batch_definition = automation_definition.batch_definitions[batch_index]
+    return run_batch(
+        automation_definition, batch_definition, user_environment)['debug']
+
+
+def _get_worker_count():
+    worker_count = getenv('CROSSCOMPUTE_WORKER_COUNT')
+    return int(worker_count) if worker_count else cpu_count()
+
+
+def _get_site_folder(script_environment):
+    virtual_folder = script_environment.get('VIRTUAL_ENV')
+    return get_site_folder(virtual_folder) if virtual_folder else None
+
+
+def _is_sequential(script_definitions):
+    return all(_.dependency_indices == ([
+        index - 1] if index else []) for index, _ in enumerate(
+            script_definitions))
+
+
+def _get_script_names(script_definitions):
+    return [_.id or str(i) for i, _ in enumerate(script_definitions)]
+
+
+def _get_batch_key(automation_definition, batch_definition):
+    return automation_definition.slug, batch_definition.slug
 
 
 def _get_automation_pack(automation_definitions, reference_uri):
@@ -428,13 +1587,16 @@ def _get_task_mode(automation_definition, batch_definition, file_changes):
 
 def _process_task(
         automation_definition, batch_definition, user_environment, task_mode,
-        server_uri):
+        server_uri, attempt_count=1):
     batch_clock = batch_definition.clock
+    return_code = None
     try:
         if task_mode == Task.RUN_PRINT:
             with batch_clock.time('run'):
-                run_batch(
-                    automation_definition, batch_definition, user_environment)
+                d = run_batch(
+                    automation_definition, batch_definition, user_environment,
+                    attempt_count) or {}
+            return_code = d.get('debug', {}).get('return_code')
         with batch_clock.time('print'):
             print_batch(
                 automation_definition, batch_definition, server_uri,
@@ -444,6 +1606,27 @@ def _process_task(
         L.error(e)
     except KeyboardInterrupt:
         pass
+    return return_code
+
+
+def _is_retryable(automation_definition, return_code, attempt_count):
+    if not return_code:
+        return False
+    if attempt_count >= automation_definition.retry_attempt_count:
+        return False
+    return_codes = automation_definition.retry_return_codes
+    if return_codes is None:
+        return return_code not in (
+            Error.COMMAND_CANCELLED, Error.COMMAND_INTERRUPTED)
+    return return_code in return_codes
+
+
+def _get_next_time(due_packs, due_time_by_key):
+    while due_packs:
+        due_time, _, key = due_packs[0][:3]
+        if due_time_by_key.get(key) == due_time:
+            return due_time
+        heappop(due_packs)
 
 
 def _prepare_batch_environment(
@@ -489,7 +1672,7 @@ def _get_step_folder_by_name(automation_folder, batch_folder):
 
 def _run_script(
         script_definition, step_folder_by_name, script_environment,
-        stdout_file, stderr_file):
+        stdout_file, stderr_file, batch_signal=None):
     command_string = script_definition.get_command_string()
     if not command_string:
         return
@@ -499,30 +1682,88 @@ def _run_script(
     command_folder = automation_folder / script_folder
     return _run_command(
         command_text, command_folder, script_environment, stdout_file,
-        stderr_file)
+        stderr_file, batch_signal)
 
 
 def _run_command(
-        command_string, command_folder, script_environment, o_file, e_file):
+        command_string, command_folder, script_environment, o_file, e_file,
+        batch_signal=None):
+    command_terms = shlex.split(command_string)
+    if batch_signal:
+        batch_signal.check()
+        if command_terms:
+            command_terms[:0] = _get_resource_limit_terms(
+                batch_signal.limit_by_name)
     try:
-        process = subprocess.run(
-            shlex.split(command_string),
-            check=True,
+        # Start a new session so that stopping kills the whole process group
+        process = subprocess.Popen(
+            command_terms,
             cwd=command_folder,
             env=script_environment,
             stdout=o_file,
-            stderr=e_file)
+            stderr=e_file,
+            start_new_session=True)
     except (IndexError, OSError):
         error = CrossComputeConfigurationError(
             f'could not run {shlex.quote(command_string)} in {command_folder}')
         error.code = Error.COMMAND_NOT_RUNNABLE
         raise error
-    except subprocess.CalledProcessError as e:
+    try:
+        if batch_signal:
+            with batch_signal.watch(lambda: _kill_process_group(process)):
+                return_code = _wait_for_process(process, batch_signal)
+            batch_signal.check()
+        else:
+            return_code = process.wait()
+    except KeyboardInterrupt:
+        _kill_process_group(process)
+        raise
+    if return_code != 0:
         e_file.seek(0)
         error = CrossComputeExecutionError(e_file.read().rstrip())
-        error.code = e.returncode
+        error.code = return_code
         raise error
-    return process.returncode
+    return return_code
+
+
+def _get_resource_limit_terms(limit_by_name):
+    option_terms = []
+    for name, limit in limit_by_name.items():
+        try:
+            resource_id, option_name = RESOURCE_PACK_BY_LIMIT_NAME[name]
+        except KeyError:
+            continue
+        # Stay within the hard limit so that the child can lower it
+        soft_limit, hard_limit = getrlimit(resource_id)
+        if hard_limit != RLIM_INFINITY:
+            limit = min(limit, hard_limit)
+        option_terms.append(f'--{option_name}={limit}:{limit}')
+    if not option_terms:
+        return []
+    # Let prlimit apply limits before exec because python code in a child
+    # forked from a threaded process can deadlock
+    prlimit_path = which('prlimit')
+    if not prlimit_path:
+        L.warning(
+            'could not apply limits %s because prlimit is not available',
+            ' '.join(option_terms))
+        return []
+    return [prlimit_path, *option_terms, '--']
+
+
+def _wait_for_process(process, batch_signal):
+    # Use wait4 to get the resource usage of the process and its children
+    pid, status, rusage = wait4(process.pid, 0)
+    process.returncode = return_code = waitstatus_to_exitcode(status)
+    batch_signal.record(get_usage_by_name(rusage))
+    return return_code
+
+
+def _kill_process_group(process):
+    try:
+        killpg(process.pid, SIGKILL)
+    except OSError:
+        pass
 
 
 def _process_batch(
@@ -591,20 +1832,53 @@ def _prepare_container_file_text(automation_definition):
             _.number) for _ in automation_definition.port_definitions])
 
 
+def _prepare_container_script_text(automation_definition):
+    script_definitions = automation_definition.script_definitions
+    command_texts = [
+        s.get_command_string().format(**CONTAINER_STEP_FOLDER_BY_NAME)
+        for s in script_definitions]
+    if _is_sequential(script_definitions):
+        return '\n'.join([_ + CONTAINER_PIPE_TEXT for _ in command_texts])
+    # Run each level of the script graph in parallel chunks
+    worker_count = automation_definition.script_worker_count
+    script_names = _get_script_names(script_definitions)
+    lines = ['return_code=0', "trap '" + '; '.join(
+        CONTAINER_MERGE_TEXT.format(name=_) for _ in script_names) + "' EXIT"]
+    for indices in get_script_levels(script_definitions):
+        for i in range(0, len(indices), worker_count):
+            chunk_indices = indices[i:i + worker_count]
+            for index in chunk_indices:
+                lines.extend([
+                    f'({command_texts[index]})' + CONTAINER_SPLIT_TEXT.format(
+                        name=script_names[index]) + ' &',
+                    f'p{index}=$!'])
+            lines.extend([
+                f'wait $p{_} || return_code=$?' for _ in chunk_indices])
+            lines.append('[ $return_code -eq 0 ] || exit $return_code')
+    return '\n'.join(lines)
+
+
 def _has_podman_image(image_name):
     return _run_podman_command({}, [
         'image', 'exists', image_name]).returncode == 0
 
 
-def _run_podman_image(automation_definition, batch_folder, custom_environment):
+def get_container_pool(automation_definition):
+    image_name = _get_image_name(automation_definition)
+    with CONTAINER_POOL_LOCK:
+        try:
+            container_pool = CONTAINER_POOL_BY_IMAGE_NAME[image_name]
+        except KeyError:
+            container_pool = CONTAINER_POOL_BY_IMAGE_NAME[
+                image_name] = ContainerPool(automation_definition)
+    return container_pool
+
+
+def _start_podman_container(automation_definition):
     automation_folder = automation_definition.folder
-    container_env_path = automation_folder / CONTAINER_ENV_NAME
-    script_environment = _prepare_script_environment(
-        CONTAINER_STEP_FOLDER_BY_NAME, custom_environment, with_path=False)
-    container_env_path.write_text('\n'.join(
-        f'{k}={v}' for k, v in script_environment.items()))
     port_definitions = automation_definition.port_definitions
     image_name = _get_image_name(automation_definition)
+    host_folder = Path(make_random_folder(CONTAINERS_FOLDER, ID_LENGTH))
     port_packs, command_terms = [], []
     for port_definition in port_definitions:
         port_id = port_definition.id
@@ -614,25 +1888,142 @@ def _run_podman_image(automation_definition, batch_folder, custom_environment):
         container_port = port_definition.number
         port_packs.append((port_id, host_port, step_name))
         command_terms.extend(['-p', f'{host_port}:{container_port}'])
+    for dataset_definition in automation_definition.dataset_definitions:
+        if dataset_definition.mode_name != 'mount':
+            continue
+        dataset_path = dataset_definition.path
+        host_path = (automation_folder / dataset_path).resolve()
+        command_terms.extend([
+            '-v', f'{host_path}:{CONTAINER_HOME_FOLDER}/{dataset_path}:ro,z'])
+    command_terms.extend(_get_podman_limit_terms(
+        automation_definition.limit_by_name))
+    if automation_definition.podman_userns_name == 'keep-id':
+        # Map the container user to the host user to skip chown passes
+        user_id, group_id = _get_podman_image_user_pack(image_name)
+        command_terms.append(f'--userns=keep-id:uid={user_id},gid={group_id}')
     process = _run_podman_command({
         'cwd': automation_folder, 'capture_output': True,
-    }, ['run'] + command_terms + [
-        '-v', f'{automation_folder / batch_folder}:/home/user/runs/next:Z',
+    }, ['run', '--rm'] + command_terms + [
+        '-v', f'{host_folder}:{CONTAINER_RUNS_FOLDER}:Z',
         '-d', image_name])
     if process.returncode != 0:
+        rmtree(host_folder, ignore_errors=True)
         error_text = process.stderr.decode().rstrip()
         error = CrossComputeExecutionError(
             f'could not run "{image_name}"; {error_text}')
         error.code = Error.IMAGE_NOT_RUNNABLE
         raise error
     container_id = process.stdout.decode().rstrip()
-    return container_id, port_packs
+    if automation_definition.podman_userns_name == 'keep-id':
+        user_id = None
+    else:
+        user_id = _get_podman_user_id(container_id)
+    return PodmanContainer(
+        container_id, port_packs, host_folder, user_id,
+        _get_podman_cgroup_folder(container_id))
+
+
+def _get_podman_dataset_key(automation_definition):
+    automation_folder = automation_definition.folder
+    dataset_key = []
+    for dataset_definition in automation_definition.dataset_definitions:
+        if dataset_definition.mode_name != 'mount':
+            continue
+        try:
+            path_stat = (automation_folder / dataset_definition.path).stat()
+        except OSError:
+            dataset_key.append(None)
+            continue
+        dataset_key.append((
+            path_stat.st_ino, path_stat.st_size, path_stat.st_mtime_ns))
+    return tuple(dataset_key)
+
+
+def _get_podman_limit_terms(limit_by_name):
+    terms = []
+    if 'memory' in limit_by_name:
+        memory_limit = limit_by_name['memory']
+        terms.extend([
+            f'--memory={memory_limit}', f'--memory-swap={memory_limit}'])
+    if 'cpus' in limit_by_name:
+        terms.append(f'--cpus={limit_by_name["cpus"]}')
+    if 'time' in limit_by_name:
+        time_limit = limit_by_name['time']
+        terms.append(f'--ulimit=cpu={time_limit}:{time_limit}')
+    if 'files' in limit_by_name:
+        file_limit = limit_by_name['files']
+        terms.append(f'--ulimit=nofile={file_limit}:{file_limit}')
+    return terms
+
+
+def _stop_podman_container(container):
+    _run_podman_command({'capture_output': True}, ['kill', container.id])
+    if container.user_id:
+        _set_podman_folder_owner(container.host_folder, 0)
+    rmtree(container.host_folder, ignore_errors=True)
 
 
-def _get_image_name(automation_definition):
+@contextmanager
+def _bind_podman_batch(container, absolute_batch_folder, custom_environment):
+    run_id = make_random_string(ID_LENGTH)
+    host_run_folder = container.host_folder / run_id
+    container_run_folder = f'{CONTAINER_RUNS_NAME}/{run_id}'
+    input_folder = absolute_batch_folder / 'input'
+    if input_folder.exists():
+        copytree(input_folder, host_run_folder / 'input', symlinks=False)
+    for step_name in STEP_NAMES:
+        (host_run_folder / step_name).mkdir(parents=True, exist_ok=True)
+    env_path = container.host_folder / f'{run_id}.env'
+    script_environment = _prepare_script_environment({
+        _ + '_folder': f'{container_run_folder}/{_}' for _ in STEP_NAMES
+    }, custom_environment, with_path=False)
+    env_path.write_text('\n'.join(
+        f'{k}={v}' for k, v in script_environment.items()))
+    if container.user_id:
+        _set_podman_folder_owner(host_run_folder, container.user_id)
+    try:
+        yield env_path
+    finally:
+        if container.user_id:
+            _set_podman_folder_owner(host_run_folder, 0)
+        for step_name in 'output', 'log', 'debug':
+            copytree(
+                host_run_folder / step_name,
+                absolute_batch_folder / step_name,
+                symlinks=True, dirs_exist_ok=True)
+        rmtree(host_run_folder, ignore_errors=True)
+        env_path.unlink(missing_ok=True)
+
+
+def _get_image_name(
+        automation_definition, container_file_text=None,
+        container_script_text=None):
+    automation_folder = automation_definition.folder
+    if container_file_text is None:
+        with CONTAINER_POOL_LOCK:
+            image_name = IMAGE_NAME_BY_FOLDER.get(automation_folder)
+        if image_name:
+            return image_name
+        PodmanEngine(with_rebuild=False).prepare(automation_definition)
+        return IMAGE_NAME_BY_FOLDER[automation_folder]
     automation_slug = automation_definition.slug
     automation_version = automation_definition.version
-    return f'localhost/{automation_slug}:{automation_version}'
+    image_digest = _get_image_digest(
+        automation_definition, container_file_text, container_script_text)
+    return f'localhost/{automation_slug}:{automation_version}-{image_digest}'
+
+
+def _get_image_digest(
+        automation_definition, container_file_text, container_script_text):
+    h = sha256()
+    h.update(container_file_text.encode())
+    h.update(container_script_text.encode())
+    h.update(get_json_bytes({
+        k: sorted(v) for k, v in
+        automation_definition.package_ids_by_manager_name.items()}))
+    update_hash(h, automation_definition.folder, CONTAINER_IGNORE_TEXT.split(
+        '\n') + [CONTAINER_SCRIPT_NAME])
+    return h.hexdigest()[:IMAGE_DIGEST_LENGTH]
 
 
 # TODO: Check if this works in jupyterlab extension
@@ -677,12 +2068,33 @@ def _proxy_podman_ports(
 def _copy_datasets_into_podman(container_id, automation_definition):
     automation_folder = automation_definition.folder
     for dataset_definition in automation_definition.dataset_definitions:
+        if dataset_definition.mode_name != 'copy':
+            continue
         dataset_path = dataset_definition.path
         _make_podman_folder(container_id, dataset_path.parent)
         _run_podman_command({'cwd': automation_folder}, [
             'cp', dataset_path, f'{container_id}:{dataset_path}'])
 
 
+def _get_podman_image_user_pack(image_name):
+    with CONTAINER_POOL_LOCK:
+        if image_name in PODMAN_USER_PACK_BY_IMAGE_NAME:
+            return PODMAN_USER_PACK_BY_IMAGE_NAME[image_name]
+    process = _run_podman_command({'capture_output': True}, [
+        'run', '--rm', image_name, 'sh', '-c', 'id -u && id -g'])
+    try:
+        user_id, group_id = process.stdout.decode().split()
+    except ValueError:
+        error_text = process.stderr.decode().rstrip()
+        error = CrossComputeExecutionError(
+            f'could not get user of "{image_name}"; {error_text}')
+        error.code = Error.IMAGE_NOT_RUNNABLE
+        raise error
+    with CONTAINER_POOL_LOCK:
+        PODMAN_USER_PACK_BY_IMAGE_NAME[image_name] = user_id, group_id
+    return user_id, group_id
+
+
 def _get_podman_user_id(container_id):
     process = _run_podman_command({
         'capture_output': True,
@@ -705,6 +2117,97 @@ def _run_podman_command(options, terms):
     return subprocess.run(command_terms, **options)
 
 
+def _get_podman_cgroup_folder(container_id):
+    process = _run_podman_command({
+        'stdout': subprocess.PIPE, 'stderr': subprocess.DEVNULL,
+    }, ['inspect', '--format', '{{.State.CgroupPath}}', container_id])
+    cgroup_path = process.stdout.decode().strip()
+    if not cgroup_path:
+        return
+    cgroup_folder = CGROUP_FOLDER / cgroup_path.lstrip('/')
+    if (cgroup_folder / 'cpu.stat').exists():
+        return cgroup_folder
+
+
+@contextmanager
+def _measure_podman_usage(container, batch_signal):
+    # Count only this batch because pooled containers run many batches
+    peak_file = _reset_podman_memory_peak(container.cgroup_folder)
+    try:
+        yield
+        if batch_signal.code:
+            return
+        old_usage_by_name = container.usage_by_name
+        usage_by_name = container.usage_by_name = _get_podman_usage_by_name(
+            container)
+        batch_usage_by_name = {_: usage_by_name[_] - (
+            old_usage_by_name[_] if old_usage_by_name else 0)
+            for _ in SUMMED_USAGE_NAMES}
+        memory_in_bytes = usage_by_name['maximum_memory_in_bytes']
+        if peak_file:
+            peak_file.seek(0)
+            memory_in_bytes = int(peak_file.read())
+        elif old_usage_by_name:
+            # Label the peak because it covers every batch of the container
+            batch_usage_by_name['maximum_lifetime_memory_in_bytes'] = \
+                memory_in_bytes
+            memory_in_bytes = 0
+        batch_usage_by_name['maximum_memory_in_bytes'] = memory_in_bytes
+        batch_signal.record(batch_usage_by_name)
+    finally:
+        if peak_file:
+            peak_file.close()
+
+
+def _reset_podman_memory_peak(cgroup_folder):
+    if not cgroup_folder:
+        return
+    try:
+        peak_file = (cgroup_folder / 'memory.peak').open('r+b', buffering=0)
+    except OSError:
+        return
+    try:
+        # Linux 6.12 resets the peak as seen through this file descriptor
+        peak_file.write(b'reset\n')
+    except OSError:
+        peak_file.close()
+        return
+    return peak_file
+
+
+def _get_podman_usage_by_name(container):
+    cgroup_folder = container.cgroup_folder
+    try:
+        cgroup_text = ''.join((
+            cgroup_folder / _).read_text() for _ in CGROUP_FILE_NAMES)
+    except (OSError, TypeError):
+        # Read the files from inside the container in one call otherwise
+        process = _run_podman_command({
+            'stdout': subprocess.PIPE, 'stderr': subprocess.DEVNULL,
+        }, ['exec', container.id, 'cat'] + [
+            f'{CGROUP_FOLDER}/{_}' for _ in CGROUP_FILE_NAMES])
+        cgroup_text = process.stdout.decode()
+    usage_by_name = dict.fromkeys(USAGE_NAMES, 0)
+    for line in cgroup_text.splitlines():
+        terms = line.split()
+        if len(terms) == 1 and terms[0].isdigit():
+            # memory.peak
+            usage_by_name['maximum_memory_in_bytes'] = int(terms[0])
+        elif len(terms) == 2 and terms[0] in ('user_usec', 'system_usec'):
+            # cpu.stat
+            name = terms[0].replace('_usec', '_time_in_seconds')
+            usage_by_name[name] = int(terms[1]) / 1000000
+        else:
+            # io.stat
+            for term in terms[1:]:
+                key, _, value = term.partition('=')
+                if key in ('rbytes', 'wbytes'):
+                    name = 'read_size_in_bytes' if key == 'rbytes' else (
+                        'write_size_in_bytes')
+                    usage_by_name[name] += int(value)
+    return usage_by_name
+
+
 def _process_podman_return_code(return_code, absolute_batch_folder):
     if return_code in [126, 127]:
         x = 'denied permission' if return_code == 126 else 'not found'
@@ -757,10 +2260,37 @@ EXPOSE {{ ' '.join(port_numbers) }}
 COPY --chown=user:user . .
 CMD ["sleep", "infinity"]''', trim_blocks=True)
 CONTAINER_PIPE_TEXT = (
-    ' 1>runs/next/debug/stdout.txt'
-    ' 2>runs/next/debug/stderr.txt')
+    ' 1>>"$CROSSCOMPUTE_DEBUG_FOLDER/stdout.txt"'
+    ' 2>>"$CROSSCOMPUTE_DEBUG_FOLDER/stderr.txt"')
+CONTAINER_SPLIT_TEXT = (
+    ' 1>"$CROSSCOMPUTE_DEBUG_FOLDER/stdout-{name}.txt"'
+    ' 2>"$CROSSCOMPUTE_DEBUG_FOLDER/stderr-{name}.txt"')
+CONTAINER_MERGE_TEXT = (
+    'cat "$CROSSCOMPUTE_DEBUG_FOLDER/stdout-{name}.txt"'
+    ' >>"$CROSSCOMPUTE_DEBUG_FOLDER/stdout.txt" 2>/dev/null; '
+    'cat "$CROSSCOMPUTE_DEBUG_FOLDER/stderr-{name}.txt"'
+    ' >>"$CROSSCOMPUTE_DEBUG_FOLDER/stderr.txt" 2>/dev/null')
 CONTAINER_SCRIPT_NAME = '.run.sh'
-CONTAINER_ENV_NAME = '.run.env'
+CGROUP_FILE_NAMES = ['cpu.stat', 'io.stat', 'memory.peak']
+CGROUP_FOLDER = Path('/sys/fs/cgroup')
+CONTAINER_HOME_FOLDER = '/home/user'
+CONTAINER_RUNS_NAME = 'runs'
+CONTAINER_RUNS_FOLDER = f'{CONTAINER_HOME_FOLDER}/{CONTAINER_RUNS_NAME}'
 CONTAINER_STEP_FOLDER_BY_NAME = {
-    _ + '_folder': 'runs/next/' + _ for _ in STEP_NAMES}
+    _ + '_folder': f'"$CROSSCOMPUTE_{_.upper()}_FOLDER"' for _ in STEP_NAMES}
+CONTAINER_REAP_INTERVAL_IN_SECONDS = 10
+COORDINATOR_LEASE_IN_SECONDS = 60
+COORDINATOR_POLL_IN_SECONDS = 5
+CONTAINER_POOL_BY_IMAGE_NAME = {}
+BATCH_SIGNAL_BY_FOLDER = {}
+BATCH_WORKER_PACK = []
+VECTOR_TABLE_NAME = 'batches.csv'
+RESOURCE_PACK_BY_LIMIT_NAME = {
+    'memory': (RLIMIT_AS, 'as'),
+    'time': (RLIMIT_CPU, 'cpu'),
+    'files': (RLIMIT_NOFILE, 'nofile')}
+IMAGE_NAME_BY_FOLDER = {}
+IMAGE_DIGEST_LENGTH = 16
+PODMAN_USER_PACK_BY_IMAGE_NAME = {}
+CONTAINER_POOL_LOCK = Lock()
 L = getLogger(__name__)
@@ -0,0 +1,55 @@
+from argparse import ArgumentParser
+from logging import getLogger
+
+from crosscompute.constants import (
+    LOGGING_LEVEL_BY_PACKAGE_NAME)
+from crosscompute.exceptions import (
+    CrossComputeError)
+from crosscompute.macros.log import (
+    configure_argument_parser_for_logging,
+    configure_logging_from)
+from crosscompute.routines.configuration import (
+    get_size_in_bytes)
+from crosscompute.routines.dataset import (
+    collect_garbage)
+
+
+def do(arguments=None):
+    a = ArgumentParser()
+    configure_argument_parser_for_logging(a)
+    configure_argument_parser_for_pruning(a)
+    args = a.parse_args(arguments)
+    try:
+        configure_logging_from(args, LOGGING_LEVEL_BY_PACKAGE_NAME)
+        configure_pruning_from(args)
+    except CrossComputeError as e:
+        L.error(e)
+        raise SystemExit
+    prune_with(args)
+
+
+def configure_argument_parser_for_pruning(a):
+    a.add_argument(
+        '--dataset-budget', metavar='X', dest='dataset_budget_text',
+        help='keep unreferenced dataset blobs up to this size, e.g. "10 GB"')
+
+
+def configure_pruning_from(args):
+    dataset_budget_text = args.dataset_budget_text
+    args.dataset_budget_in_bytes = get_size_in_bytes(
+        dataset_budget_text.strip()) if dataset_budget_text else 0
+
+
+def prune_with(args):
+    removed_count, removed_size = collect_garbage(
+        args.dataset_budget_in_bytes)
+    L.info(
+        'removed %s unreferenced dataset blobs totaling %s bytes',
+        removed_count, removed_size)
+
+
+L = getLogger(__name__)
+
+
+if __name__ == '__main__':
+    do()
@@ -1,3 +1,4 @@
+import sys
 from argparse import ArgumentParser
 from logging import getLogger
 
@@ -15,6 +16,10 @@ from crosscompute.routines.automation import (
 from crosscompute.scripts.configure import (
     configure_argument_parser_for_configuring,
     configure_with)
+from crosscompute.scripts.datasets import (
+    configure_argument_parser_for_pruning,
+    configure_pruning_from,
+    prune_with)
 from crosscompute.scripts.print import (
     print_with)
 from crosscompute.scripts.run import (
@@ -31,12 +36,17 @@ from crosscompute.settings import (
 
 
 def do(arguments=None):
+    if arguments is None:
+        arguments = sys.argv[1:]
     args = _get_args(arguments)
     L.info(f'launching crosscompute {__version__}')
     launch_id = get_launch_id_from(args)
     if launch_id == 'configure':
         configure_with(args)
         return
+    if launch_id == 'prune':
+        prune_with(args)
+        return
     automation = _get_automation_from(args)
     if launch_id == 'print':
         print_with(automation, args)
@@ -72,6 +82,9 @@ def configure_argument_parser_for_launching(a):
     a.add_argument(
         '--print', dest='is_print_only', action='store_true',
         help='print only')
+    a.add_argument(
+        '--prune-datasets', dest='is_prune_only', action='store_true',
+        help='remove unreferenced dataset blobs only')
     a.add_argument(
         '--version', dest='is_version_only', action='store_true',
         help='show version')
@@ -81,12 +94,14 @@ def get_launch_id_from(args):
     launch_id = 'all'
     if args.is_configure_only:
         launch_id = 'configure'
-    elif args.is_run_only:
+    elif args.is_run_only or args.coordinator_address or args.worker_address:
         launch_id = 'run'
     elif args.is_serve_only:
         launch_id = 'serve'
     elif args.is_print_only:
         launch_id = 'print'
+    elif args.is_prune_only:
+        launch_id = 'prune'
     return launch_id
 
 
@@ -97,6 +112,7 @@ def _get_args(arguments):
     configure_argument_parser_for_configuring(a)
     configure_argument_parser_for_serving(a)
     configure_argument_parser_for_running(a)
+    configure_argument_parser_for_pruning(a)
     args = a.parse_args(arguments)
     if args.is_version_only:
         print(__version__)
@@ -105,6 +121,7 @@ def _get_args(arguments):
         configure_logging_from(args, LOGGING_LEVEL_BY_PACKAGE_NAME)
         configure_serving_from(args)
         configure_running_from(args)
+        configure_pruning_from(args)
     except CrossComputeError as e:
         L.error(e)
         raise SystemExit
@@ -14,7 +14,8 @@ from crosscompute.scripts.configure import (
     configure_argument_parser_for_configuring)
 from crosscompute.scripts.run import (
     configure_argument_parser_for_running,
-    configure_running_from)
+    configure_running_from,
+    shard_with)
 
 
 def do(arguments=None):
@@ -34,6 +35,7 @@ def do(arguments=None):
 
 
 def print_with(automation, args):
+    shard_with(automation, args)
     automation.print(args.environment)
 
 
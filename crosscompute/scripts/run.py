@@ -2,7 +2,11 @@ from argparse import ArgumentParser
 from logging import getLogger
 from os import getenv
 
+from crosscompute.constants import (
+    COORDINATOR_PORT,
+    HOST)
 from crosscompute.exceptions import (
+    CrossComputeConfigurationError,
     CrossComputeError)
 from crosscompute.macros.log import (
     configure_argument_parser_for_logging,
@@ -33,6 +37,19 @@ def configure_argument_parser_for_running(a):
     a.add_argument(
         '--no-rebuild', dest='with_rebuild', action='store_false',
         help='do not rebuild container images')
+    a.add_argument(
+        '--coordinator', metavar='X', dest='coordinator_address', nargs='?',
+        const=f'{HOST}:{COORDINATOR_PORT}',
+        help='publish batches to workers at host:port or socket path')
+    a.add_argument(
+        '--worker', metavar='X', dest='worker_address',
+        help='run batches from coordinator at host:port or socket path')
+    a.add_argument(
+        '--shard', metavar='X', dest='shard_text',
+        help='run only batches whose slug hashes to shard i/n')
+    a.add_argument(
+        '--changed-only', dest='is_changed_only', action='store_true',
+        help='run only batches whose inputs, scripts or datasets changed')
 
 
 def configure_running_from(args):
@@ -40,15 +57,49 @@ def configure_running_from(args):
     origin_uri = getenv('CROSSCOMPUTE_ORIGIN_URI') or (
         f'http://localhost:{port}' if port else 'http://localhost')
     args.environment = {'CROSSCOMPUTE_ORIGIN_URI': origin_uri}
+    args.shard_pack = get_shard_pack(args.shard_text)
+
+
+def get_shard_pack(shard_text):
+    if not shard_text:
+        return
+    try:
+        shard_index, shard_count = [int(_) for _ in shard_text.split('/')]
+    except ValueError:
+        raise CrossComputeConfigurationError(
+            f'shard "{shard_text}" is not parsable; '
+            f'something like "3/8" was expected')
+    if not 1 <= shard_index <= shard_count:
+        raise CrossComputeConfigurationError(
+            f'shard "{shard_text}" must be between 1/{shard_count} and '
+            f'{shard_count}/{shard_count}')
+    return shard_index - 1, shard_count
+
+
+def shard_with(automation, args):
+    if args.shard_pack:
+        automation.shard(*args.shard_pack)
 
 
 def run_with(automation, args):
-    return run(automation, args.environment, args.with_rebuild)
+    shard_with(automation, args)
+    if args.is_changed_only:
+        automation.select_changed()
+    return run(
+        automation, args.environment, args.with_rebuild,
+        args.coordinator_address, args.worker_address)
 
 
-def run(automation, environment, with_rebuild=True):
+def run(
+        automation, environment, with_rebuild=True, coordinator_address=None,
+        worker_address=None):
     try:
-        automation.run(environment, with_rebuild=with_rebuild)
+        if coordinator_address:
+            automation.coordinate(coordinator_address)
+        elif worker_address:
+            automation.work(environment, worker_address, with_rebuild)
+        else:
+            automation.run(environment, with_rebuild=with_rebuild)
     except CrossComputeError as e:
         L.error(e)
     except KeyboardInterrupt:
@@ -26,6 +26,9 @@ site = {
     'uris': [],
     'tasks': [],
     'changes': {},
+    'wakeup': None,
+    'queues': {},
+    'submitted_count_by_slug': {},
     'with_prefix': True,
     'with_hidden': True}
 template_path_by_id = TEMPLATE_PATH_BY_ID.copy()
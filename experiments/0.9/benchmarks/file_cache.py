@@ -0,0 +1,84 @@
+# Compare milliseconds per output step render when FileCache validates each
+# hit with a stat call versus when a watcher invalidates entries on change
+# python file_cache.py --variable-count 50
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from crosscompute.macros import disk
+from crosscompute.routines.automation import DiskAutomation
+from crosscompute.routines.batch import DiskBatch
+from crosscompute.routines.database import FILE_JSON_CACHE
+from crosscompute.routines.step import (
+    get_layout_settings,
+    get_step_response_dictionary)
+from crosscompute.routines.variable import FILE_DATA_CACHE
+
+
+def do():
+    a = ArgumentParser()
+    a.add_argument('--variable-count', type=int, default=50)
+    a.add_argument('--render-count', type=int, default=200)
+    args = a.parse_args()
+    with TemporaryDirectory() as folder:
+        folder = Path(folder)
+        make_automation(folder, args.variable_count)
+        automation_definition = DiskAutomation.load(folder).definitions[0]
+        batch = DiskBatch(
+            automation_definition, automation_definition.batch_definitions[0])
+        file_caches = FILE_DATA_CACHE, FILE_JSON_CACHE
+        for mode_name in 'stat', 'watch':
+            if mode_name == 'watch':
+                for file_cache in file_caches:
+                    file_cache.watch([folder])
+            for file_cache in file_caches:
+                file_cache.clear()
+            render(batch)
+            stat_count = count_stats(render, batch)
+            t = perf_counter()
+            for render_index in range(args.render_count):
+                render(batch)
+            milliseconds = (perf_counter() - t) * 1000 / args.render_count
+            print(
+                f'{mode_name}: {milliseconds:.3f} milliseconds and '
+                f'{stat_count} cache stats per render of '
+                f'{args.variable_count} variables')
+
+
+def make_automation(folder, variable_count):
+    variable_ids = [f'y{_}' for _ in range(variable_count)]
+    variable_lines = ''.join((
+        f'    - id: {_}\n'
+        '      view: number\n'
+        '      path: variables.dictionary\n') for _ in variable_ids)
+    (folder / 'automate.yaml').write_text(
+        '---\ncrosscompute: 0.9.4\nname: X\n'
+        f'output:\n  variables:\n{variable_lines}'
+        'batches:\n  - folder: batches/x\n')
+    output_folder = folder / 'batches' / 'x' / 'output'
+    output_folder.mkdir(parents=True)
+    (output_folder / 'variables.dictionary').write_text('{%s}' % ', '.join(
+        f'"{_}": {i}' for i, _ in enumerate(variable_ids)))
+
+
+def render(batch):
+    layout_settings = get_layout_settings(
+        batch.automation_definition.get_design_name('output'), {})
+    return get_step_response_dictionary(
+        batch, 'output', '', layout_settings, {})
+
+
+def count_stats(f, *args):
+    stat = disk.stat
+    paths = []
+    disk.stat = lambda _: paths.append(_) or stat(_)
+    try:
+        f(*args)
+    finally:
+        disk.stat = stat
+    return len(paths)
+
+
+if __name__ == '__main__':
+    do()
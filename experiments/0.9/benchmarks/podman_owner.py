@@ -0,0 +1,77 @@
+# Compare seconds per batch when podman file ownership is fixed with
+# recursive chown passes versus a keep-id user namespace, where both modes
+# reuse one warm container the way ContainerPool does
+# python podman_owner.py --image localhost/automation-x:0.0.0
+import subprocess
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import time
+
+
+def do():
+    a = ArgumentParser()
+    a.add_argument(
+        '--image', required=True,
+        help='image built by crosscompute with engine=podman')
+    a.add_argument('--file-count', type=int, default=5000)
+    a.add_argument('--batch-count', type=int, default=5)
+    args = a.parse_args()
+    user_id, group_id = get_user_pack(args.image)
+    with TemporaryDirectory() as folder:
+        folder = Path(folder)
+        for mode_name, run in [
+                ('chown', run_chown_batch), ('keep-id', run_keep_id_batch)]:
+            mode_folder = folder / mode_name
+            mode_folder.mkdir()
+            container_id = start_container(
+                args.image, mode_folder,
+                [f'--userns=keep-id:uid={user_id},gid={group_id}'] if (
+                    mode_name == 'keep-id') else [])
+            seconds = []
+            for batch_index in range(args.batch_count):
+                batch_folder = mode_folder / str(batch_index)
+                batch_folder.mkdir()
+                t = time()
+                run(args.image, container_id, batch_folder, user_id,
+                    args.file_count)
+                seconds.append(time() - t)
+            podman('kill', container_id)
+            podman('unshare', 'chown', '0:0', str(mode_folder), '-R')
+            print(f'{mode_name}: {sum(seconds) / len(seconds):.3f} seconds '
+                  f'per batch of {args.file_count} files')
+
+
+def run_chown_batch(image, container_id, batch_folder, user_id, file_count):
+    podman('unshare', 'chown', f'{user_id}:{user_id}', str(batch_folder), '-R')
+    podman('exec', container_id, 'sh', '-c', get_write_command(
+        f'/home/user/runs/{batch_folder.name}', file_count))
+    podman('unshare', 'chown', '0:0', str(batch_folder), '-R')
+
+
+def run_keep_id_batch(image, container_id, batch_folder, user_id, file_count):
+    podman('exec', container_id, 'sh', '-c', get_write_command(
+        f'/home/user/runs/{batch_folder.name}', file_count))
+
+
+def start_container(image, folder, terms):
+    return podman(*['run', '--rm', '-d'] + terms + [
+        '-v', f'{folder}:/home/user/runs:Z', image, 'sleep', 'infinity'])
+
+
+def get_user_pack(image):
+    return podman('run', '--rm', image, 'sh', '-c', 'id -u && id -g').split()
+
+
+def get_write_command(folder, file_count):
+    return f'for i in $(seq {file_count}); do echo $i > {folder}/$i.txt; done'
+
+
+def podman(*terms):
+    return subprocess.run(
+        ['podman', *terms], check=True, capture_output=True,
+    ).stdout.decode().strip()
+
+
+if __name__ == '__main__':
+    do()
@@ -0,0 +1,77 @@
+from hashlib import sha256
+from os import utime
+
+from crosscompute.macros import disk
+from crosscompute.macros.disk import FileCache, update_hash
+from crosscompute.macros.resource import get_memory_size
+
+
+def test_file_cache(monkeypatch, tmp_path):
+    path = tmp_path / 'x.txt'
+    path.write_text('1')
+    file_cache = FileCache(
+        load_file_data=lambda _: _.read_text(), maximum_size_in_bytes=1024)
+    assert file_cache[path] == '1'
+    path.write_text('2')
+    utime(path, (0, 0))
+    assert file_cache[path] == '2'
+    file_cache.watch([tmp_path])
+    assert file_cache[path] == '2'
+    path.write_text('3')
+    stat = disk.stat
+    stat_paths = []
+    monkeypatch.setattr(disk, 'stat', lambda _: stat_paths.append(
+        _) or stat(_))
+    assert file_cache[path] == '3'
+    assert file_cache[path] == '3'
+    assert len(stat_paths) == 2
+    path.write_text('4')
+    assert file_cache[path] == '3'
+    file_cache.invalidate([str(path)])
+    assert file_cache[path] == '4'
+    file_cache.unwatch()
+    path.write_text('5')
+    utime(path, (1, 1))
+    assert file_cache[path] == '5'
+
+
+def test_file_cache_size(tmp_path):
+    entry_size = disk.ENTRY_SIZE_IN_BYTES + get_memory_size('x' * 50)
+    file_cache = FileCache(
+        load_file_data=lambda _: _.read_text(),
+        maximum_size_in_bytes=entry_size * 2)
+    paths = [tmp_path / f'{_}.txt' for _ in range(3)]
+    for path in paths:
+        path.write_text('x' * 50)
+    file_cache[paths[0]], file_cache[paths[1]], file_cache[paths[0]]
+    assert (file_cache.hit_count, file_cache.miss_count) == (1, 2)
+    file_cache[paths[2]]
+    assert file_cache.eviction_count == 1
+    assert list(file_cache) == [paths[0], paths[2]]
+    assert file_cache.size_in_bytes == 2 * entry_size
+    assert file_cache.get_statistics()['eviction_count'] == 1
+    paths[2].write_text('x' * 1000)
+    utime(paths[2], (0, 0))
+    assert len(file_cache[paths[2]]) == 1000
+    assert list(file_cache) == [paths[0]]
+
+
+def test_update_hash(tmp_path):
+    (tmp_path / 'run.py').write_text('print(1)')
+    (tmp_path / 'batches').mkdir()
+    (tmp_path / 'batches' / 'x.txt').write_text('x')
+    excluded_patterns = ['**/batches']
+    digest = update_hash(sha256(), tmp_path, excluded_patterns).hexdigest()
+    (tmp_path / 'batches' / 'x.txt').write_text('y')
+    assert update_hash(
+        sha256(), tmp_path, excluded_patterns).hexdigest() == digest
+    (tmp_path / 'run.py').write_text('print(2)')
+    assert update_hash(
+        sha256(), tmp_path, excluded_patterns).hexdigest() != digest
+
+
+def test_get_memory_size():
+    value = {'a': ['x' * 1000, 'y' * 1000]}
+    assert get_memory_size(value) > 2000
+    value['b'] = value['a']
+    assert get_memory_size(value) < 2 * get_memory_size({'a': value['a']})
@@ -0,0 +1,77 @@
+from asyncio import run
+from threading import Event
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+from pytest import fixture, raises
+
+from crosscompute.constants import Task
+from crosscompute.routers.automation import (
+    cancel_automation_batch_json,
+    run_automation_json,
+    see_automation_queue_json)
+from crosscompute.settings import site
+
+
+@fixture
+def automation_definition(monkeypatch, tmp_path):
+    for key, value in {
+        'tasks': [], 'wakeup': Event(), 'environment': {}, 'queues': {},
+        'submitted_count_by_slug': {},
+    }.items():
+        monkeypatch.setitem(site, key, value)
+    return SimpleNamespace(
+        slug='a', folder=tmp_path, queue_length=2, batch_definitions=[],
+        get_variable_definitions=lambda step_name: [])
+
+
+def test_run_automation_json(automation_definition):
+    guard = SimpleNamespace(save_identities=lambda path: None)
+
+    def run_automation():
+        return run(run_automation_json(automation_definition, {}, guard))
+
+    run_automation()
+    run_automation()
+    with raises(HTTPException) as e:
+        run_automation()
+    assert e.value.status_code == 429
+    assert e.value.headers['Retry-After'] == '1'
+    assert len(site['tasks']) == 2
+    assert site['wakeup'].is_set()
+    site['queues']['a'] = {
+        'pending_count': 1, 'collected_count': 2, 'retry_in_seconds': 5}
+    run_automation()
+    with raises(HTTPException) as e:
+        run_automation()
+    assert e.value.headers['Retry-After'] == '5'
+    assert len(automation_definition.batch_definitions) == 3
+
+
+def test_see_automation_queue_json(automation_definition):
+    d = run(see_automation_queue_json(automation_definition, None))
+    assert set(d['file_cache_by_name']['data']) >= {
+        'hit_count', 'miss_count', 'eviction_count'}
+    site['queues']['a'] = {'pending_count': 1}
+    d = run(see_automation_queue_json(automation_definition, None))
+    assert d['pending_count'] == 1
+
+
+def test_cancel_automation_batch_json(automation_definition):
+    batch_definition = SimpleNamespace(folder='batches/x')
+    assert run(cancel_automation_batch_json(
+        automation_definition, batch_definition, None)) == {}
+    assert site['tasks'] == [(
+        automation_definition, batch_definition, {}, Task.CANCEL)]
+    assert site['wakeup'].is_set()
+
+
+def test_run_automation_json_with_error(automation_definition):
+    def save_identities(path):
+        raise OSError
+
+    guard = SimpleNamespace(save_identities=save_identities)
+    with raises(OSError):
+        run(run_automation_json(automation_definition, {}, guard))
+    assert site['submitted_count_by_slug']['a'] == 0
+    assert not site['tasks']
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+from crosscompute.routines import cache
+from crosscompute.routines.cache import (
+    get_batch_digest,
+    get_path_digest,
+    restore_batch,
+    save_batch)
+from crosscompute.routines.configuration import ScriptDefinition
+
+
+def test_save_and_restore_batch(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'RESULTS_FOLDER', tmp_path / 'results')
+    a_folder = tmp_path / 'a'
+    b_folder = tmp_path / 'b'
+    a_folder.joinpath('output').mkdir(parents=True)
+    a_folder.joinpath('output', 'x.txt').write_text('x')
+    a_folder.joinpath('debug').mkdir()
+    a_folder.joinpath('debug', 'identities.dictionary').write_text('{}')
+    assert not restore_batch(b_folder, 'abc')
+    save_batch(a_folder, 'abc')
+    b_folder.joinpath('output').mkdir(parents=True)
+    b_folder.joinpath('output', 'y.txt').write_text('y')
+    assert restore_batch(b_folder, 'abc')
+    assert b_folder.joinpath('output', 'x.txt').read_text() == 'x'
+    assert not b_folder.joinpath('output', 'y.txt').exists()
+    assert not b_folder.joinpath('debug', 'identities.dictionary').exists()
+
+
+def test_get_path_digest(tmp_path):
+    path = tmp_path / 'x.txt'
+    assert get_path_digest(path) == ''
+    path.write_text('1')
+    digest = get_path_digest(path)
+    assert get_path_digest(path) == digest
+    path.write_text('22')
+    assert get_path_digest(path) != digest
+    assert get_path_digest(tmp_path) != get_path_digest(tmp_path / 'y')
+
+
+def test_get_path_digest_with_folder(monkeypatch, tmp_path):
+    folder = tmp_path / 'x'
+    folder.joinpath('y').mkdir(parents=True)
+    folder.joinpath('y', 'z.txt').write_text('1')
+    digest = get_path_digest(folder)
+    update_hash = cache.update_hash
+    paths = []
+    monkeypatch.setattr(
+        cache, 'update_hash', lambda h, _: paths.append(_) or update_hash(
+            h, _))
+    assert get_path_digest(folder) == digest
+    assert not paths
+    folder.joinpath('y', 'z.txt').write_text('22')
+    assert get_path_digest(folder) != digest
+    assert paths == [folder]
+
+
+def test_get_batch_digest_with_function(tmp_path):
+    module_path = tmp_path / 'x' / 'y.py'
+    module_path.parent.mkdir()
+    module_path.write_text('def f():\n    pass\n')
+    script_definition = ScriptDefinition(
+        {'function': 'x.y.f'}, automation_folder=tmp_path)
+    assert script_definition.get_source_paths() == [module_path]
+    automation_definition = SimpleNamespace(
+        folder=tmp_path, script_definitions=[script_definition],
+        package_ids_by_manager_name={})
+    digest = get_batch_digest(automation_definition, 'batches/a', {}, {})
+    module_path.write_text('def f():\n    return 1\n')
+    assert get_batch_digest(
+        automation_definition, 'batches/a', {}, {}) != digest
@@ -5,10 +5,12 @@ from crosscompute.exceptions import (
     CrossComputeConfigurationError,
     CrossComputeError)
 from crosscompute.routines.configuration import (
+    get_limit_by_name,
     process_header_footer_options,
     process_page_number_options,
     validate_automation_identifiers,
     validate_protocol,
+    validate_scripts,
     validate_templates,
     validate_variables)
 
@@ -27,6 +29,19 @@ def test_validate_protocol():
     validate_protocol({'crosscompute': __version__})
 
 
+def test_get_limit_by_name():
+    assert get_limit_by_name({}) == {}
+    assert get_limit_by_name({
+        'memory': '512 MB', 'cpus': 1.5, 'time': '2 minutes', 'files': 64,
+    }) == {
+        'memory': 512 * 1024 ** 2, 'cpus': 1.5, 'time': 120, 'files': 64}
+    assert get_limit_by_name({'memory': 1024}) == {'memory': 1024}
+    with raises(CrossComputeConfigurationError):
+        get_limit_by_name({'memory': '2 XB'})
+    with raises(CrossComputeConfigurationError):
+        get_limit_by_name({'cpus': 0})
+
+
 def test_validate_automation_identifiers():
     d = validate_automation_identifiers(DummyConfiguration({}))
     assert d['name'] == 'Automation 0'
@@ -93,6 +108,26 @@ def test_validate_templates(tmp_path):
     assert len(d['template_definitions_by_step_name']['input']) == 1
 
 
+def test_validate_scripts(tmp_path):
+    c = DummyConfiguration({'scripts': [
+        {'id': 'a', 'command': 'a'},
+        {'id': 'b', 'command': 'b', 'after': []},
+        {'id': 'c', 'command': 'c', 'after': ['a', 'b']},
+        {'command': 'd'}]})
+    c.folder = tmp_path
+    d = validate_scripts(c)
+    assert [_.dependency_indices for _ in d['script_definitions']] == [
+        [], [], [0, 1], [2]]
+
+    c['scripts'][0]['after'] = 'c'
+    with raises(CrossComputeConfigurationError):
+        validate_scripts(c)
+
+    c['scripts'][0]['after'] = 'x'
+    with raises(CrossComputeConfigurationError):
+        validate_scripts(c)
+
+
 def test_process_header_footer_options():
     d = {'header-footer': {}}
     process_header_footer_options('x', d)
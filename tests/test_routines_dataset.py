@@ -0,0 +1,123 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+from os import utime
+from threading import Thread
+
+import requests
+from pytest import fixture, raises
+
+from crosscompute.routines import dataset
+from crosscompute.exceptions import CrossComputeDataError
+from crosscompute.routines.dataset import (
+    collect_garbage,
+    download_dataset,
+    download_datasets,
+    get_blob_path)
+
+
+class DatasetHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.status_codes.append(None)
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            server.status_codes[-1] = 304
+            return
+        self.send_response(200)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+        server.status_codes[-1] = 200
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, 'DATASETS_FOLDER', tmp_path / 'datasets')
+    monkeypatch.setattr(dataset, 'BLOBS_FOLDER', tmp_path / 'datasets' / 'b')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DatasetHandler)
+    server.etag, server.body, server.status_codes = '"1"', b'a,b\n1,2\n', []
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def test_download_dataset(server, tmp_path):
+    uri = 'http://127.0.0.1:%s/x.csv' % server.server_address[1]
+    target_path = tmp_path / 'x.csv'
+    download_datasets([(uri, target_path, 0)])
+    assert target_path.read_bytes() == server.body
+    with requests.Session() as session:
+        download_dataset(session, uri, target_path)
+        assert server.status_codes == [200, 304]
+        download_dataset(session, uri, target_path, max_age_in_seconds=60)
+        assert server.status_codes == [200, 304]
+        server.etag, server.body = '"2"', b'a,b\n3,4\n'
+        download_dataset(session, uri, target_path)
+        assert server.status_codes == [200, 304, 200]
+    assert target_path.read_bytes() == server.body
+    server.shutdown()
+    server.server_close()
+    download_datasets([(uri, target_path, 0)])
+    assert target_path.read_bytes() == server.body
+
+
+def test_download_dataset_by_content(server, tmp_path):
+    uri = 'http://127.0.0.1:%s/x.csv' % server.server_address[1]
+    x_path, y_path = tmp_path / 'x' / 'x.csv', tmp_path / 'y' / 'x.csv'
+    download_datasets([(uri, x_path, 0), (uri, y_path, 0)])
+    assert x_path.samefile(y_path)
+    blob_path = x_path.resolve()
+    assert blob_path.stat().st_nlink == 3
+    with requests.Session() as session:
+        with raises(CrossComputeDataError):
+            download_dataset(session, uri, tmp_path / 'z.csv', 0, '0' * 64)
+        assert not (tmp_path / 'z.csv').exists()
+        x_path.chmod(0o644)
+        x_path.write_bytes(b'x')
+        download_dataset(session, uri, x_path, max_age_in_seconds=60)
+        download_dataset(session, uri, tmp_path / 'z.csv')
+    assert x_path.read_bytes() == server.body
+    assert (tmp_path / 'z.csv').read_bytes() == server.body
+
+
+def test_collect_garbage(server, tmp_path):
+    uri = 'http://127.0.0.1:%s/x.csv' % server.server_address[1]
+    old_path, new_path = tmp_path / 'old.csv', tmp_path / 'new.csv'
+    download_datasets([(uri, old_path, 0)])
+    old_digest = dataset.get_file_digest(old_path)
+    server.etag, server.body = '"2"', b'a,b\n3,4\n'
+    download_datasets([(uri, new_path, 0)])
+    new_digest = dataset.get_file_digest(new_path)
+    assert collect_garbage() == (0, 0)
+    old_path.unlink()
+    new_path.unlink()
+    utime(get_blob_path(old_digest), (0, 0))
+    assert collect_garbage(len(server.body)) == (1, len(server.body))
+    assert get_blob_path(new_digest).exists()
+    assert collect_garbage() == (1, len(server.body))
+    assert not list(dataset.DATASETS_FOLDER.glob('*.json'))
+
+
+def test_collect_garbage_with_copies(server, monkeypatch, tmp_path):
+
+    def link_blob(source_path, target_path):
+        # Simulate automation folders on a different device
+        if target_path.parent != dataset.BLOBS_FOLDER:
+            raise OSError
+        os.link(source_path, target_path)
+
+    monkeypatch.setattr(dataset, 'link', link_blob)
+    uri = 'http://127.0.0.1:%s/x.csv' % server.server_address[1]
+    x_path = tmp_path / 'x.csv'
+    download_datasets([(uri, x_path, 0)])
+    blob_path = get_blob_path(dataset.get_file_digest(x_path))
+    assert blob_path.stat().st_nlink == 1
+    assert collect_garbage() == (0, 0)
+    x_path.unlink()
+    assert collect_garbage() == (1, len(server.body))
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from crosscompute.routines import package
+from crosscompute.routines.package import (
+    get_package_environment,
+    get_package_folder,
+    install_system_packages)
+
+
+def test_get_package_environment():
+    assert get_package_environment({}, '/usr/bin') == {}
+    d = get_package_environment({'pip': {'a', 'b'}}, '/usr/bin')
+    package_folder = get_package_folder({'pip': {'b', 'a'}})
+    assert d['VIRTUAL_ENV'] == str(package_folder)
+    assert d['PATH'] == f'{package_folder}/bin:/usr/bin'
+
+
+def test_install_system_packages(monkeypatch):
+    command_terms_list, return_codes = [], [0]
+
+    def run(terms, **kwargs):
+        command_terms_list.append(terms)
+        return SimpleNamespace(returncode=return_codes[0])
+
+    monkeypatch.setattr(package.subprocess, 'run', run)
+    install_system_packages({'apt': {'b', 'a'}, 'pip': {'c'}})
+    assert command_terms_list == [['dpkg', '-s', 'a', 'b']]
+    return_codes[0] = 1
+    install_system_packages({'apt': {'b', 'a'}})
+    assert command_terms_list[-1] == ['apt', 'install', 'a', 'b']
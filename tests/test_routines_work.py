@@ -1,10 +1,39 @@
+import json
+import tarfile
+from datetime import timedelta
+from functools import partial
+from pathlib import Path
+from threading import Event
+from time import time
+from types import SimpleNamespace
+
 from pytest import raises
 
+from crosscompute.constants import (
+    Error,
+    Task)
 from crosscompute.exceptions import (
     CrossComputeConfigurationError,
     CrossComputeExecutionError)
+from crosscompute.routines import cache, function, work
+from crosscompute.routines.automation import (
+    DiskAutomation)
+from crosscompute.routines.function import (
+    FunctionPool)
+from crosscompute.routines.package import (
+    get_site_folder)
 from crosscompute.routines.work import (
-    _run_command)
+    BatchSignal,
+    ContainerPool,
+    CoordinatorQueue,
+    TaskScheduler,
+    _pack_batch,
+    _run_command,
+    _unpack_batch,
+    get_coordinator_address,
+    get_shard_index,
+    prepare_automation,
+    run_automation)
 
 
 def test_run_command(tmp_path):
@@ -16,3 +45,572 @@ def test_run_command(tmp_path):
         with raises(CrossComputeExecutionError):
             _run_command('python x', tmp_path, {}, o_file, e_file)
         _run_command('python --help', tmp_path, {}, o_file, e_file)
+
+
+def test_run_command_with_timeout(tmp_path):
+    o_path = tmp_path / 'o.txt'
+    e_path = tmp_path / 'e.txt'
+    batch_signal = BatchSignal(timedelta(seconds=0.5))
+    start_time = time()
+    with open(o_path, 'wt') as o_file, open(e_path, 'w+t') as e_file:
+        with raises(CrossComputeExecutionError) as e:
+            _run_command(
+                'sleep 10', tmp_path, {}, o_file, e_file, batch_signal)
+    assert e.value.code == Error.COMMAND_TIMED_OUT
+    assert time() - start_time < 5
+
+
+def test_run_command_with_limits(tmp_path):
+    o_path = tmp_path / 'o.txt'
+    e_path = tmp_path / 'e.txt'
+    batch_signal = BatchSignal(limit_by_name={'files': 64})
+    with open(o_path, 'wt') as o_file, open(e_path, 'w+t') as e_file:
+        _run_command(
+            'sh -c "ulimit -n"', tmp_path, {}, o_file, e_file,
+            batch_signal)
+    assert o_path.read_text().strip() == '64'
+
+
+def test_get_coordinator_address():
+    assert get_coordinator_address('/tmp/x.sock') == '/tmp/x.sock'
+    assert get_coordinator_address('10.0.0.1:7100') == ('10.0.0.1', 7100)
+    assert get_coordinator_address(':7100') == ('127.0.0.1', 7100)
+    with raises(CrossComputeConfigurationError):
+        get_coordinator_address('x')
+
+
+def test_get_shard_index():
+    shard_indices = [get_shard_index(str(_), 8) for _ in range(100)]
+    assert set(shard_indices) == set(range(8))
+    assert get_shard_index('x', 8) == get_shard_index('x', 8)
+
+
+def test_pack_batch(tmp_path):
+    source_folder, target_folder = tmp_path / 'source', tmp_path / 'target'
+    for step_name in 'input', 'output', 'debug':
+        source_folder.joinpath(step_name).mkdir(parents=True)
+        source_folder.joinpath(step_name, 'x.txt').write_text(step_name)
+    _unpack_batch(target_folder, _pack_batch(source_folder))
+    assert not target_folder.joinpath('input').exists()
+    assert target_folder.joinpath('output', 'x.txt').read_text() == 'output'
+    assert target_folder.joinpath('debug', 'x.txt').read_text() == 'debug'
+
+
+def test_unpack_batch_without_filter(monkeypatch, tmp_path):
+    source_folder, target_folder = tmp_path / 'source', tmp_path / 'target'
+    output_folder = source_folder / 'output'
+    output_folder.mkdir(parents=True)
+    output_folder.joinpath('x.txt').write_text('x')
+    output_folder.joinpath('y.txt').symlink_to('x.txt')
+    output_folder.joinpath('z.txt').symlink_to('/etc/hostname')
+    monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    _unpack_batch(target_folder, _pack_batch(source_folder))
+    assert target_folder.joinpath('output', 'y.txt').read_text() == 'x'
+    assert not target_folder.joinpath('output', 'z.txt').exists()
+
+
+def test_coordinator_queue():
+    task_queue = CoordinatorQueue(['a', 'b'])
+    assert task_queue.get() == 'a'
+    assert task_queue.requeue(60) == []
+    assert task_queue.requeue(-1) == ['a']
+    assert task_queue.get() == 'b'
+    assert task_queue.get() == 'a'
+    task_queue.finish('a')
+    assert task_queue.requeue(-1) == ['b']
+
+
+def test_work_for_coordinator(tmp_path):
+    tasks, results = [('a', 0, 'x'), ('a', 1, 'y')], []
+
+    def get(timeout):
+        if not tasks:
+            raise EOFError
+        return tasks.pop(0)
+
+    def run_batch(
+            automation_definition, batch_definition, user_environment):
+        if batch_definition.folder == 'y':
+            raise OSError
+        (tmp_path / 'x' / 'output').mkdir(parents=True)
+
+    run_batch = partial(run_batch, SimpleNamespace(folder=tmp_path))
+    task_queue = SimpleNamespace(get=get, renew=lambda task: None)
+    result_queue = SimpleNamespace(put=results.append)
+    work._work_for_coordinator(
+        task_queue, result_queue, {'a': run_batch}, {
+            ('a', 'x'): SimpleNamespace(folder='x'),
+            ('a', 'y'): SimpleNamespace(folder='y')}, {})
+    assert [_[:2] for _ in results] == [('a', 0), ('a', 1)]
+    assert results[0][2] and not results[1][2]
+
+
+def test_function_pool(tmp_path):
+    tmp_path.joinpath('run.py').write_text(
+        'import os\n'
+        'def f(output_folder):\n'
+        '    print(os.environ["X"])\n'
+        '    (output_folder / "x.txt").write_text(os.environ["X"])\n'
+        'def g():\n'
+        '    raise ValueError("whee")\n')
+    o_path, e_path = tmp_path / 'o.txt', tmp_path / 'e.txt'
+    step_folder_by_name = {'output_folder': tmp_path}
+    function_pool = FunctionPool(tmp_path, 'run.f', worker_count=1)
+    try:
+        assert function_pool.run(
+            step_folder_by_name, {'X': '1'}, o_path, e_path) == 0
+        assert function_pool.run(
+            step_folder_by_name, {'X': '2'}, o_path, e_path) == 0
+    finally:
+        function_pool.stop()
+    assert o_path.read_text() == '1\n2\n'
+    assert tmp_path.joinpath('x.txt').read_text() == '2'
+    function_pool = FunctionPool(tmp_path, 'run.g', worker_count=1)
+    try:
+        assert function_pool.run(
+            step_folder_by_name, {}, o_path, e_path) == 1
+    finally:
+        function_pool.stop()
+    assert 'whee' in e_path.read_text()
+
+
+def test_function_pool_with_site_folder(tmp_path):
+    site_folder = get_site_folder(tmp_path / 'environment')
+    site_folder.mkdir(parents=True)
+    site_folder.joinpath('venvonly.py').write_text('x = "whee"\n')
+    tmp_path.joinpath('run.py').write_text(
+        'import venvonly\n'
+        'def f():\n'
+        '    print(venvonly.x)\n')
+    o_path, e_path = tmp_path / 'o.txt', tmp_path / 'e.txt'
+    function_pool = FunctionPool(
+        tmp_path, 'run.f', worker_count=1, site_folder=site_folder)
+    try:
+        assert function_pool.run({}, {}, o_path, e_path) == 0
+    finally:
+        function_pool.stop()
+    assert o_path.read_text() == 'whee\n'
+
+
+def test_function_pool_usage(tmp_path):
+    tmp_path.joinpath('run.py').write_text(
+        'def f():\n'
+        '    x = bytearray(100 * 1024 * 1024)\n'
+        'def g():\n'
+        '    pass\n')
+    o_path, e_path = tmp_path / 'o.txt', tmp_path / 'e.txt'
+    memory_sizes = []
+    for function_string in 'run.f', 'run.g':
+        function_pool = FunctionPool(tmp_path, function_string, 1)
+        try:
+            for index in range(2):
+                batch_signal = BatchSignal()
+                function_pool.run({}, {}, o_path, e_path, batch_signal)
+                memory_sizes.append(batch_signal.usage_by_name[
+                    'maximum_memory_in_bytes'])
+        finally:
+            function_pool.stop()
+    assert min(memory_sizes[:2]) > 100 * 1024 * 1024
+    assert max(memory_sizes[2:]) < 100 * 1024 * 1024
+
+
+def test_measure_podman_usage(monkeypatch, tmp_path):
+    tmp_path.joinpath('cpu.stat').write_text(
+        'usage_usec 3000000\nuser_usec 2000000\nsystem_usec 1000000\n')
+    tmp_path.joinpath('io.stat').write_text('8:0 rbytes=10 wbytes=20\n')
+    tmp_path.joinpath('memory.peak').write_text('100\n')
+    monkeypatch.setattr(work, '_reset_podman_memory_peak', lambda _: None)
+    container = work.PodmanContainer('c', [], tmp_path, None, tmp_path)
+    batch_signal = BatchSignal()
+    with work._measure_podman_usage(container, batch_signal):
+        pass
+    assert batch_signal.usage_by_name == {
+        'maximum_memory_in_bytes': 100, 'user_time_in_seconds': 2,
+        'system_time_in_seconds': 1, 'read_size_in_bytes': 10,
+        'write_size_in_bytes': 20}
+    tmp_path.joinpath('cpu.stat').write_text(
+        'usage_usec 4000000\nuser_usec 3000000\nsystem_usec 1000000\n')
+    batch_signal = BatchSignal()
+    with work._measure_podman_usage(container, batch_signal):
+        pass
+    assert batch_signal.usage_by_name['user_time_in_seconds'] == 1
+    assert batch_signal.usage_by_name['read_size_in_bytes'] == 0
+    assert batch_signal.usage_by_name['maximum_memory_in_bytes'] == 0
+    assert batch_signal.usage_by_name[
+        'maximum_lifetime_memory_in_bytes'] == 100
+    command_terms_list = []
+
+    def run_podman_command(options, terms):
+        command_terms_list.append(terms)
+        return SimpleNamespace(stdout=b'200\n')
+
+    monkeypatch.setattr(work, '_run_podman_command', run_podman_command)
+    container = work.PodmanContainer('c', [], tmp_path, None)
+    batch_signal = BatchSignal()
+    with work._measure_podman_usage(container, batch_signal):
+        pass
+    assert len(command_terms_list) == 1
+    assert batch_signal.usage_by_name['maximum_memory_in_bytes'] == 200
+
+
+def test_task_scheduler_wakeup(monkeypatch):
+    run_time = time() - 61
+    b = SimpleNamespace(slug='b', folder='b', clock=SimpleNamespace(
+        get_end_time=lambda _: run_time, get_start_time=lambda _: None))
+    a = SimpleNamespace(
+        slug='a', queue_size=1, queue_weight=1, is_interval_strict=True,
+        interval_timedelta=timedelta(seconds=60), batch_definitions=[b],
+        is_interval_ready=lambda _: True, retry_attempt_count=1)
+    process_packs = []
+    monkeypatch.setattr(
+        work, '_process_task', lambda *args: process_packs.append(args))
+    wakeup, queues = Event(), {}
+    task_scheduler = TaskScheduler([a], {}, '', wakeup, queues)
+    assert task_scheduler.get_timeout() == 0
+    task_scheduler.collect([], [], {})
+    task_scheduler.dispatch()
+    assert queues['a']['running_count'] == 1
+    assert wakeup.wait(1)
+    assert process_packs[0][:2] == (a, b)
+    run_time = time()
+    task_scheduler.collect([], [], {})
+    task_scheduler.dispatch()
+    assert queues['a']['running_count'] == 0
+    assert 59 < task_scheduler.get_timeout() <= 60
+
+
+def test_task_scheduler_coalescing():
+    a = SimpleNamespace(slug='a')
+    b = SimpleNamespace(slug='b')
+    task_scheduler = TaskScheduler([], {}, '', None, {})
+    task_scheduler.add((a, b, {}, Task.PRINT_ONLY))
+    task_scheduler.add((a, b, {}, Task.RUN_PRINT))
+    task_scheduler.add((a, b, {}, Task.PRINT_ONLY))
+    assert list(task_scheduler._pending_task_by_key.values()) == [
+        (a, b, {}, Task.RUN_PRINT)]
+    task_scheduler._pending_task_by_key.clear()
+    task_scheduler._running_keys.add(('a', 'b'))
+    task_scheduler.add((a, b, {}, Task.RUN_PRINT))
+    task_scheduler.add((a, b, {}, Task.RUN_PRINT))
+    assert not task_scheduler._pending_task_by_key
+    assert len(task_scheduler._follow_up_task_by_key) == 1
+
+
+def test_task_scheduler_fairness():
+    a = SimpleNamespace(
+        slug='a', queue_size=1, queue_weight=1, is_interval_strict=False)
+    b = SimpleNamespace(
+        slug='b', queue_size=1, queue_weight=3, is_interval_strict=False)
+    task_scheduler = TaskScheduler([], {}, '', None, {})
+    task_scheduler.worker_count = 1
+    task_scheduler._process_task = lambda *args: None
+    pack_by_key = {}
+    for automation_definition in a, b:
+        for index in range(8):
+            batch_definition = SimpleNamespace(slug=str(index))
+            pack_by_key[automation_definition.slug, str(index)] = (
+                automation_definition, batch_definition)
+            task_scheduler.add((
+                automation_definition, batch_definition, {}, Task.RUN_PRINT))
+    batch_definition = SimpleNamespace(slug='x')
+    pack_by_key['a', 'x'] = a, batch_definition
+    task_scheduler.add(
+        (a, batch_definition, {}, Task.RUN_PRINT), is_interactive=True)
+    keys = []
+    for _ in range(9):
+        task_scheduler.dispatch()
+        key = task_scheduler._running_keys.copy().pop()
+        keys.append(key)
+        task_scheduler._finish(pack_by_key[key] + ({}, Task.RUN_PRINT), 1)
+    assert keys[0] == ('a', 'x')
+    assert 6 <= [_[0] for _ in keys[1:]].count('b') <= 7
+
+
+def test_task_scheduler_retry():
+    a = SimpleNamespace(
+        slug='a', name='A', version='0', queue_size=1, queue_weight=1,
+        is_interval_strict=False, retry_attempt_count=2,
+        retry_backoff_timedelta=timedelta(seconds=0), retry_return_codes=None)
+    b = SimpleNamespace(slug='b', folder='b')
+    task_scheduler = TaskScheduler([], {}, '', None, {})
+    task_scheduler._process_task = lambda *args: None
+    automation_task = a, b, {}, Task.RUN_PRINT
+    task_scheduler.add(automation_task)
+    task_scheduler.dispatch()
+    task_scheduler._finish(automation_task, 1, 1)
+    assert task_scheduler.get_timeout() == 0
+    task_scheduler.collect([], [], {})
+    assert task_scheduler._attempt_count_by_key[('a', 'b')] == 2
+    task_scheduler.dispatch()
+    task_scheduler._finish(automation_task, 1, 1)
+    assert task_scheduler.get_timeout() is None
+    task_scheduler.add(automation_task)
+    task_scheduler.dispatch()
+    task_scheduler._finish(automation_task, 1, Error.COMMAND_CANCELLED)
+    assert task_scheduler.get_timeout() is None
+
+
+def test_container_pool(monkeypatch):
+    started_ids, stopped_ids = [], []
+
+    def start(automation_definition):
+        started_ids.append(str(len(started_ids)))
+        return SimpleNamespace(id=started_ids[-1])
+
+    monkeypatch.setattr(work, '_start_podman_container', start)
+    monkeypatch.setattr(
+        work, '_stop_podman_container', lambda _: stopped_ids.append(_.id))
+    container_pool = ContainerPool(SimpleNamespace(
+        folder=Path(), container_pool_size=2, dataset_definitions=[],
+        container_idle_timedelta=timedelta(seconds=60)))
+    container = container_pool.checkout()
+    container_pool.checkin(container)
+    assert container_pool.checkout() is container
+    other_container = container_pool.checkout()
+    assert started_ids == ['0', '1']
+    container_pool.checkin(other_container, is_reusable=False)
+    assert stopped_ids == ['1']
+    container_pool.checkin(container)
+    container_pool.stop()
+    assert stopped_ids == ['1', '0']
+    container_pool.checkin(container_pool.checkout())
+    assert stopped_ids == ['1', '0', '2']
+
+
+def test_start_podman_container(monkeypatch, tmp_path):
+    command_terms_list = []
+
+    def run_podman_command(options, terms):
+        command_terms_list.append(terms)
+        return SimpleNamespace(returncode=0, stdout=b'c\n', stderr=b'')
+
+    monkeypatch.setattr(work, 'CONTAINERS_FOLDER', tmp_path)
+    monkeypatch.setattr(work, '_run_podman_command', run_podman_command)
+    monkeypatch.setattr(work, 'IMAGE_NAME_BY_FOLDER', {tmp_path: 'x'})
+    automation_definition = SimpleNamespace(
+        folder=tmp_path, port_definitions=[], dataset_definitions=[],
+        limit_by_name={'memory': '1g'}, podman_userns_name='chown')
+    container = work._start_podman_container(automation_definition)
+    assert container.id == 'c'
+    assert container.host_folder.parent == tmp_path
+    run_terms, exec_terms, inspect_terms = command_terms_list
+    assert run_terms[:4] == [
+        'run', '--rm', '--memory=1g', '--memory-swap=1g']
+    assert run_terms[-2:] == ['-d', 'x']
+    assert exec_terms == ['exec', 'c', 'id', '-u']
+    assert inspect_terms[0] == 'inspect'
+    assert container.cgroup_folder is None
+
+
+def test_start_podman_container_with_keep_id(monkeypatch, tmp_path):
+    command_terms_list = []
+
+    def run_podman_command(options, terms):
+        command_terms_list.append(terms)
+        return SimpleNamespace(returncode=0, stdout=b'1000 100\n', stderr=b'')
+
+    monkeypatch.setattr(work, 'CONTAINERS_FOLDER', tmp_path)
+    monkeypatch.setattr(work, '_run_podman_command', run_podman_command)
+    monkeypatch.setattr(work, 'IMAGE_NAME_BY_FOLDER', {tmp_path: 'x'})
+    monkeypatch.setattr(work, 'PODMAN_USER_PACK_BY_IMAGE_NAME', {})
+    automation_definition = SimpleNamespace(
+        folder=tmp_path, port_definitions=[], dataset_definitions=[],
+        limit_by_name={}, podman_userns_name='keep-id')
+    container = work._start_podman_container(automation_definition)
+    assert container.user_id is None
+    user_terms, run_terms, inspect_terms = command_terms_list
+    assert user_terms[-1] == 'id -u && id -g'
+    assert '--userns=keep-id:uid=1000,gid=100' in run_terms
+
+
+def test_container_pool_with_changed_dataset(monkeypatch, tmp_path):
+    started_ids, stopped_ids = [], []
+
+    def start(automation_definition):
+        started_ids.append(str(len(started_ids)))
+        return SimpleNamespace(id=started_ids[-1])
+
+    monkeypatch.setattr(work, '_start_podman_container', start)
+    monkeypatch.setattr(
+        work, '_stop_podman_container', lambda _: stopped_ids.append(_.id))
+    dataset_path = tmp_path / 'datasets' / 'x.csv'
+    dataset_path.parent.mkdir()
+    dataset_path.write_text('a')
+    container_pool = ContainerPool(SimpleNamespace(
+        folder=tmp_path, container_pool_size=1,
+        container_idle_timedelta=timedelta(seconds=60),
+        dataset_definitions=[SimpleNamespace(
+            path=Path('datasets/x.csv'), mode_name='mount')]))
+    container = container_pool.checkout()
+    container_pool.checkin(container)
+    assert container_pool.checkout() is container
+    new_path = tmp_path / 'datasets' / 'y.csv'
+    new_path.write_text('bb')
+    new_path.replace(dataset_path)
+    container_pool.checkin(container)
+    assert container_pool.checkout() is not container
+    assert stopped_ids == ['0']
+    container_pool.stop()
+
+
+def test_prepare_podman_image(monkeypatch, tmp_path):
+    command_terms_list, image_names = [], []
+
+    def run_podman_command(options, terms):
+        command_terms_list.append(terms)
+        return SimpleNamespace(returncode=int(
+            terms[:2] == ['image', 'exists'] and terms[2] not in image_names))
+
+    monkeypatch.setattr(work, '_run_podman_command', run_podman_command)
+    monkeypatch.setattr(work, 'IMAGE_NAME_BY_FOLDER', {})
+    (tmp_path / 'run.py').write_text('')
+    automation_definition = SimpleNamespace(
+        folder=tmp_path, slug='a', version='0', parent_image_name='python',
+        package_ids_by_manager_name={}, port_definitions=[],
+        script_definitions=[SimpleNamespace(
+            dependency_indices=[],
+            get_command_string=lambda: 'python run.py')])
+    podman_engine = work.PodmanEngine(with_rebuild=False)
+    podman_engine.prepare(automation_definition)
+    image_name = work.IMAGE_NAME_BY_FOLDER[tmp_path]
+    assert image_name.startswith('localhost/a:0-')
+    assert command_terms_list[-1][:3] == ['build', '-t', image_name]
+    image_names.append(image_name)
+    command_terms_list.clear()
+    (tmp_path / 'datasets').mkdir()
+    (tmp_path / 'datasets' / 'x.csv').write_text('')
+    podman_engine.prepare(automation_definition)
+    assert work.IMAGE_NAME_BY_FOLDER[tmp_path] == image_name
+    assert command_terms_list == [['image', 'exists', image_name]]
+    (tmp_path / 'run.py').write_text('print(1)')
+    podman_engine.prepare(automation_definition)
+    assert work.IMAGE_NAME_BY_FOLDER[tmp_path] != image_name
+    assert command_terms_list[-1][0] == 'build'
+
+
+def test_run_automation_multiple_with_process(tmp_path):
+    automation_definition = SimpleNamespace(
+        # Use a lambda to check that the definition is never pickled
+        get_folder=lambda: tmp_path,
+        batch_definitions=[SimpleNamespace(slug=_) for _ in 'abc'])
+
+    def run_batch(automation_definition, batch_definition, user_environment):
+        path = automation_definition.get_folder() / batch_definition.slug
+        path.write_text(user_environment['X'])
+        return {'debug': {'execution_time_in_seconds': 0}}
+
+    work._run_automation_multiple(
+        automation_definition, run_batch, {'X': 'x'}, 'process')
+    assert [_.read_text() for _ in sorted(tmp_path.iterdir())] == ['x'] * 3
+
+
+def test_run_automation_multiple_with_warm_process(monkeypatch, tmp_path):
+    monkeypatch.setenv('CROSSCOMPUTE_WORKER_COUNT', '2')
+    batch_names = [str(_) for _ in range(8)]
+    batch_text = ''.join(f'  - folder: batches/{_}\n' for _ in batch_names)
+    tmp_path.joinpath('automate.yaml').write_text(
+        '---\ncrosscompute: 0.9.4\nname: X\n'
+        'input:\n  variables:\n'
+        '    - id: a\n      view: number\n      path: variables.dictionary\n'
+        'output:\n  variables:\n'
+        '    - id: b\n      view: number\n      path: variables.dictionary\n'
+        f'batches:\n{batch_text}'
+        'scripts:\n  - function: run.f\n'
+        'environment:\n  engine: warm\n  batch: process\n')
+    tmp_path.joinpath('run.py').write_text(
+        'import json, time\n'
+        'def f(input_folder):\n'
+        '    path = input_folder / "variables.dictionary"\n'
+        '    time.sleep(0.1)\n'
+        '    raise SystemExit(json.loads(path.read_text())["a"])\n')
+    for batch_name in batch_names:
+        input_folder = tmp_path / 'batches' / batch_name / 'input'
+        input_folder.mkdir(parents=True)
+        input_folder.joinpath('variables.dictionary').write_text(
+            '{"a": %s}' % (int(batch_name) % 2 * 7))
+    automation_definition = DiskAutomation.load(tmp_path).definitions[0]
+    # Start workers in the parent so that forked batch workers inherit them
+    prepare_automation(automation_definition, with_rebuild=False)
+    try:
+        run_automation(automation_definition, {}, with_rebuild=False)
+    finally:
+        for function_pool in function.FUNCTION_POOL_BY_KEY.values():
+            function_pool.stop()
+        function.FUNCTION_POOL_BY_KEY.clear()
+    for batch_name in batch_names:
+        debug_data_by_id = json.loads(tmp_path.joinpath(
+            'batches', batch_name, 'debug', 'variables.dictionary',
+        ).read_text())
+        assert debug_data_by_id['return_code'] == int(batch_name) % 2 * 7
+
+
+def test_run_automation_vector(caplog, tmp_path):
+    tmp_path.joinpath('automate.yaml').write_text(
+        '---\ncrosscompute: 0.9.4\nname: X\n'
+        'input:\n  variables:\n'
+        '    - id: a\n      view: number\n      path: variables.dictionary\n'
+        'output:\n  variables:\n'
+        '    - id: b\n      view: number\n      path: variables.dictionary\n'
+        'batches:\n  - folder: batches/x\n  - folder: batches/y\n'
+        'scripts:\n  - path: run.py\n'
+        'environment:\n  batch: vector\n  chunk: 2\n')
+    tmp_path.joinpath('run.py').write_text(
+        'import csv\n'
+        'from os import environ\n'
+        'from pathlib import Path\n'
+        'i = Path(environ["CROSSCOMPUTE_INPUT_FOLDER"])\n'
+        'o = Path(environ["CROSSCOMPUTE_OUTPUT_FOLDER"])\n'
+        'rows = list(csv.DictReader((i / "batches.csv").open()))\n'
+        'with (o / "batches.csv").open("wt") as f:\n'
+        '    f.write("b\\n")\n'
+        '    for index, row in enumerate(rows):\n'
+        '        f.write(str(int(row["a"]) * 10) + "\\n")\n'
+        '        (o / str(index)).mkdir()\n'
+        '        (o / str(index) / "x.txt").write_text(row["a"])\n')
+    for batch_name, a in ('x', 1), ('y', 2):
+        input_folder = tmp_path / 'batches' / batch_name / 'input'
+        input_folder.mkdir(parents=True)
+        input_folder.joinpath('variables.dictionary').write_text(
+            '{"a": %s}' % a)
+    automation_definition = DiskAutomation.load(tmp_path).definitions[0]
+    run_automation(automation_definition, {}, with_rebuild=False)
+    for batch_name, a in ('x', 1), ('y', 2):
+        batch_folder = tmp_path / 'batches' / batch_name
+        output_folder = batch_folder / 'output'
+        assert json.loads(output_folder.joinpath(
+            'variables.dictionary').read_text()) == {'b': a * 10}
+        assert output_folder.joinpath('x.txt').read_text() == str(a)
+        debug_data_by_id = json.loads(batch_folder.joinpath(
+            'debug', 'variables.dictionary').read_text())
+        assert debug_data_by_id['return_code'] == 0
+        assert debug_data_by_id['vector_size'] == 2
+        assert debug_data_by_id['attempt_count'] == 1
+    assert not [_ for _ in caplog.records if _.levelname == 'ERROR']
+
+
+def test_run_automation_with_cache(caplog, monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'RESULTS_FOLDER', tmp_path / 'results')
+    automation_folder = tmp_path / 'automation'
+    automation_folder.mkdir()
+    automation_folder.joinpath('automate.yaml').write_text(
+        '---\ncrosscompute: 0.9.4\nname: X\n'
+        'output:\n  variables:\n'
+        '    - id: b\n      view: number\n      path: variables.dictionary\n'
+        'batches:\n  - folder: batches/x\n'
+        'scripts:\n  - path: run.py\n'
+        'environment:\n  batch: single\n  cache: true\n')
+    automation_folder.joinpath('run.py').write_text(
+        'from os import environ\n'
+        'from pathlib import Path\n'
+        'o = Path(environ["CROSSCOMPUTE_OUTPUT_FOLDER"])\n'
+        '(o / "variables.dictionary").write_text(\'{"b": 1}\')\n')
+    automation_definition = DiskAutomation.load(
+        automation_folder).definitions[0]
+    for index in range(2):
+        run_automation(automation_definition, {}, with_rebuild=False)
+    debug_data_by_id = json.loads(automation_folder.joinpath(
+        'batches', 'x', 'debug', 'variables.dictionary').read_text())
+    assert debug_data_by_id['is_cache_hit']
+    assert debug_data_by_id['attempt_count'] == 1
+    assert debug_data_by_id['output_size_in_bytes'] > 0
+    assert not [_ for _ in caplog.records if _.levelname == 'ERROR']